@@ -0,0 +1,136 @@
+import collections
+import os
+import threading
+import time
+
+import twiml
+
+# Defaults for NOLANG_ADMISSION, e.g. 'rate=1,burst=10,workers=4,queue=64,deadline=2'.
+OPTIONS = {
+    # Messages a phone may send per second, sustained, and in a burst.
+    'rate': 1.0,
+    'burst': 10.0,
+    # Messages evaluated at once, and how many more may wait for a turn.
+    'workers': 4,
+    'queue': 64,
+    # Seconds a message may wait for a turn before it is turned away.
+    'deadline': 2.0,
+}
+MAX_PHONES = 100000
+BUSY = twiml.response2bytes("Sorry, I'm busy right now. Please send that again in a minute.")
+
+clock = getattr(time, 'monotonic', time.time)
+
+
+class Busy(Exception):
+    pass
+
+
+class Gate(object):
+    # Per-phone token buckets in front of a bounded queue for a fixed number
+    # of evaluation slots. A message is shed, not delayed without limit, if
+    # its phone is over its rate, the queue is full or its deadline passes.
+    def __init__(self, rate, burst, workers, queue, deadline):
+        self.rate = rate
+        self.burst = burst
+        self.queue = queue
+        self.deadline = deadline
+        self.lock = threading.Lock()
+        self.slots = threading.Semaphore(workers)
+        # phone -> [tokens, last refill]; least recently seen first.
+        self.phone2bucket = collections.OrderedDict()
+        self.waiting = 0
+        self.max_waiting = 0
+        self.running = 0
+        self.admitted = 0
+        self.reason2shed = dict((reason, 0) for reason in ('rate', 'queue', 'deadline'))
+
+    def take(self, phone, now):
+        # Called with the lock held.
+        bucket = self.phone2bucket.pop(phone, None)
+        if bucket is None:
+            bucket = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        self.phone2bucket[phone] = bucket
+        if len(self.phone2bucket) > MAX_PHONES:
+            self.phone2bucket.popitem(last=False)
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def shed(self, reason):
+        self.reason2shed[reason] += 1
+        raise Busy(reason)
+
+    def run(self, phone, function):
+        start = clock()
+        with self.lock:
+            # The queue first, so a message turned away for want of room
+            # does not also spend one of its phone's tokens.
+            if self.waiting >= self.queue:
+                self.shed('queue')
+            if not self.take(phone, start):
+                self.shed('rate')
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+        admitted = self.slots.acquire(timeout=self.deadline)
+        with self.lock:
+            self.waiting -= 1
+            if not admitted:
+                self.shed('deadline')
+            self.running += 1
+            self.admitted += 1
+        try:
+            return function()
+        finally:
+            with self.lock:
+                self.running -= 1
+            self.slots.release()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'queue_depth': self.waiting,
+                'max_queue_depth': self.max_waiting,
+                'running': self.running,
+                'admitted': self.admitted,
+                'shed': dict(self.reason2shed),
+                'phones': len(self.phone2bucket),
+            }
+
+
+def parse(spec):
+    options = dict(OPTIONS)
+    for item in spec.replace(' ', ',').split(','):
+        if not item or item in ('1', 'on'):
+            continue
+        key, equals, value = item.partition('=')
+        if not equals or key not in OPTIONS:
+            raise ValueError('unknown admission setting %r' % item)
+        try:
+            options[key] = type(OPTIONS[key])(value)
+        except ValueError:
+            raise ValueError('%s must be a number, not %r' % (key, value))
+    return Gate(**options)
+
+
+def run(phone, function):
+    if gate is None:
+        return function()
+    return gate.run(phone, function)
+
+
+def stats():
+    if gate is None:
+        return {'enabled': False}
+    stats = gate.stats()
+    stats['enabled'] = True
+    return stats
+
+
+# Off unless NOLANG_ADMISSION is set (to '1' for the defaults), like metrics.
+spec = os.environ.get('NOLANG_ADMISSION', '')
+gate = parse(spec) if spec not in ('', '0') else None
@@ -0,0 +1,152 @@
+import asyncio
+import json
+import os
+from urllib.parse import unquote_plus
+
+import idempotency
+import metrics
+import simple
+import twiml
+
+FIELDS = ('From', 'Body', 'MessageSid')
+MAX_BODY = 2 ** 16
+TEXT_XML = [(b'content-type', b'text/xml')]
+TEXT_PLAIN = [(b'content-type', b'text/plain')]
+APPLICATION_JSON = [(b'content-type', b'application/json')]
+# Where sessions are written on shutdown, as in webhook.py.
+SNAPSHOT = os.environ.get('NOLANG_SNAPSHOT', '')
+
+
+class FormParser(object):
+    def __init__(self, fields=FIELDS):
+        self.fields = fields
+        self.form = {}
+        self.pending = b''
+
+    def feed(self, chunk):
+        pairs = (self.pending + chunk).split(b'&')
+        self.pending = pairs.pop()
+        for pair in pairs:
+            self.pair(pair)
+
+    def close(self):
+        self.pair(self.pending)
+        self.pending = b''
+        return self.form
+
+    def pair(self, pair):
+        name, _, value = pair.partition(b'=')
+        name = unquote_plus(name.decode('latin-1'))
+        if name in self.fields and name not in self.form:
+            self.form[name] = unquote_plus(value.decode('latin-1'))
+
+
+async def respond(send, status, body, headers):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def read_form(receive):
+    parser = FormParser()
+    size = 0
+    while True:
+        event = await receive()
+        if event['type'] == 'http.disconnect':
+            return None, None
+        chunk = event.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY:
+            return None, 413
+        parser.feed(chunk)
+        if not event.get('more_body', False):
+            return parser.close(), None
+
+
+async def evaluate(phone, message):
+    if simple.phone2env.backend.persistent:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, simple.reply, phone, message)
+    return simple.reply(phone, message)
+
+
+async def cached(cache, key, function):
+    # ReplyCache.compute for a coroutine function: a duplicate waits on a
+    # future rather than blocking the event loop.
+    if not key:
+        return await function()
+    while True:
+        with cache.lock:
+            entry, first = cache.begin(key)
+            if first:
+                break
+            if idempotency.DONE == entry.state:
+                return entry.value
+            future = asyncio.get_running_loop().create_future()
+            entry.futures.append(future)
+        await future
+        if idempotency.DONE == entry.state:
+            return entry.value
+    try:
+        value = await function()
+    except BaseException:
+        cache.end(key, entry, idempotency.FAILED)
+        raise
+    cache.end(key, entry, idempotency.DONE, value)
+    return value
+
+
+async def lifespan(receive, send):
+    while True:
+        event = await receive()
+        if event['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif event['type'] == 'lifespan.shutdown':
+            if SNAPSHOT:
+                simple.phone2env.save(SNAPSHOT)
+            simple.phone2env.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def make_app(evaluate):
+    # evaluate(phone, message, sid) is awaited for each message not already
+    # answered under its MessageSid. shards.Worker passes one that routes
+    # the phone to the worker that owns it.
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await lifespan(receive, send)
+            return
+        if scope['path'] == '/metrics' and scope['method'] == 'GET':
+            snapshot = metrics.snapshot()
+            snapshot['sessions'] = simple.phone2env.stats()
+            snapshot['idempotency'] = idempotency.replies.stats()
+            await respond(send, 200, json.dumps(snapshot, sort_keys=True).encode('utf-8'), APPLICATION_JSON)
+            return
+        if scope['path'] != '/message':
+            await respond(send, 404, b'Not Found', TEXT_PLAIN)
+            return
+        if scope['method'] == 'GET':
+            parser = FormParser()
+            parser.feed(scope['query_string'])
+            form = parser.close()
+        elif scope['method'] == 'POST':
+            form, status = await read_form(receive)
+            if status is not None:
+                await respond(send, status, b'Request Entity Too Large', TEXT_PLAIN)
+                return
+            elif form is None:
+                return
+        else:
+            await respond(send, 405, b'Method Not Allowed', TEXT_PLAIN)
+            return
+        phone, message, sid = form.get('From', ''), form.get('Body', ''), form.get('MessageSid', '')
+
+        async def render():
+            return twiml.response2bytes(await evaluate(phone, message, sid))
+        body = await cached(idempotency.replies, sid, render)
+        await respond(send, 200, body, TEXT_XML)
+
+    return app
+
+
+app = make_app(lambda phone, message, sid: evaluate(phone, message))
@@ -0,0 +1,149 @@
+import csv
+import json
+import multiprocessing
+import queue
+import random
+import sys
+import zlib
+
+import sessions
+
+CHUNKSIZE = 1000
+IN_FLIGHT = 4
+# Seconds between checks that every worker is still alive.
+POLL = 1.0
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            record = json.loads(line)
+            yield record.get('phone', record.get('From', '')), record.get('body', record.get('Body', ''))
+
+
+def read_csv(f):
+    for row in csv.reader(f):
+        if row and row[0] not in ('phone', 'From'):
+            yield row[0], row[1] if len(row) > 1 else ''
+
+
+def write_jsonl(f, results):
+    for phone, body, response in results:
+        f.write(json.dumps({'phone': phone, 'body': body, 'response': response}) + '\n')
+
+
+def write_csv(f, results):
+    writer = csv.writer(f)
+    for result in results:
+        writer.writerow(result)
+
+
+def shard(phone, shards):
+    return zlib.crc32(phone.encode('utf-8')) % shards
+
+
+def worker(new_program, inbox, outbox):
+    # Each worker owns every session that hashes to it, so sym2val never
+    # crosses a process boundary; only (index, phone, body) chunks do.
+    random.seed()
+    phone2sym2val = {}
+    for chunk in iter(inbox.get, None):
+        responses = []
+        for index, phone, body in chunk:
+            sym2val = phone2sym2val.get(phone)
+            if sym2val is None:
+                sym2val = phone2sym2val[phone] = sessions.Env(sessions.MAX_HISTORY, record=False)
+            try:
+                response = new_program(sym2val=sym2val).message(body)
+            except Exception as e:
+                # One bad message (1 over 0) gets an error for its reply
+                # instead of taking the shard, and with it the batch, down.
+                response = 'Error: %s' % type(e).__name__
+            responses.append((index, response))
+        outbox.put(responses)
+
+
+def evaluate(records, new_program, processes=None, chunksize=CHUNKSIZE):
+    processes = processes or multiprocessing.cpu_count()
+    inboxes = [multiprocessing.Queue() for _ in range(processes)]
+    outbox = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=worker, args=(new_program, inbox, outbox))
+        for inbox in inboxes
+    ]
+    for process in workers:
+        process.daemon = True
+        process.start()
+
+    pending = [[] for _ in range(processes)]
+    index2record = {}
+    index2response = {}
+    state = {'in_flight': 0, 'next': 0}
+
+    def send(i):
+        if pending[i]:
+            inboxes[i].put(pending[i])
+            pending[i] = []
+            state['in_flight'] += 1
+
+    def receive():
+        while True:
+            try:
+                responses = outbox.get(timeout=POLL)
+                break
+            except queue.Empty:
+                if not all(process.is_alive() for process in workers):
+                    raise RuntimeError('a batch worker exited with messages in flight')
+        for index, response in responses:
+            index2response[index] = response
+        state['in_flight'] -= 1
+
+    def ready():
+        while state['next'] in index2response:
+            index = state['next']
+            phone, body = index2record.pop(index)
+            yield phone, body, index2response.pop(index)
+            state['next'] += 1
+
+    try:
+        for index, (phone, body) in enumerate(records):
+            index2record[index] = (phone, body)
+            i = shard(phone, processes)
+            pending[i].append((index, phone, body))
+            if len(pending[i]) >= chunksize:
+                send(i)
+            if (index + 1) % (chunksize * processes) == 0:
+                # Flush stragglers so a quiet shard cannot hold back the
+                # in-order output indefinitely.
+                for j in range(processes):
+                    send(j)
+            while state['in_flight'] > IN_FLIGHT * processes:
+                receive()
+                for result in ready():
+                    yield result
+        for i in range(processes):
+            send(i)
+        while state['in_flight']:
+            receive()
+            for result in ready():
+                yield result
+    finally:
+        for inbox in inboxes:
+            inbox.put(None)
+        for process in workers:
+            if state['in_flight']:
+                process.terminate()
+            process.join()
+
+
+def main(new_program, argv):
+    csv_format = '--csv' in argv
+    processes = None
+    if '--processes' in argv:
+        processes = int(argv[argv.index('--processes') + 1])
+    records = read_csv(sys.stdin) if csv_format else read_jsonl(sys.stdin)
+    results = evaluate(records, new_program, processes=processes)
+    if csv_format:
+        write_csv(sys.stdout, results)
+    else:
+        write_jsonl(sys.stdout, results)
@@ -0,0 +1,39 @@
+import sys
+
+from bench import micro
+from bench import suite
+
+USAGE = '''usage: python -m bench COMMAND
+
+  suite [--quick | --scale N] [--output FILE] [--baseline FILE [--threshold FRACTION]]
+  stress [--unlocked]
+  words
+  wordlist [DICTIONARY]
+  twiml
+  memory [MESSAGES [PHONES]]
+  numeric [MESSAGES]
+  snapshot [PHONES]
+  aot
+  revision REF [SCALE]
+  reactive [SYMBOLS]
+  sweep [POINTS]
+  startup
+  webhook
+  retries [MESSAGES [COPIES]]
+  overload [CONCURRENCY [COST_MS]]
+  shards [REQUESTS]
+  loadtest URL [CONCURRENCY]'''
+
+
+def main():
+    args = sys.argv[1:]
+    if not args:
+        sys.exit(USAGE)
+    if args[0] == 'suite':
+        sys.exit(suite.main(args[1:]))
+    if not micro.main(args):
+        sys.exit(USAGE)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,664 @@
+import asyncio
+import collections
+import decimal
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+import engine
+import lexer
+import numeric
+import sessions
+import simple
+import translate
+import twiml
+import words
+
+
+def percentile(latencies, fraction):
+    latencies = sorted(latencies)
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+
+def report(name, latencies, elapsed):
+    print('%s requests/s=%.0f p50=%.3fms p99=%.3fms' % (
+        name,
+        len(latencies) / elapsed,
+        1000 * percentile(latencies, 0.50),
+        1000 * percentile(latencies, 0.99),
+    ))
+
+
+def webhook_forms(requests, phones=100):
+    messages = ('1671', 'is fair', '303', 'is strike', '108 times strike', 'over fair', '108 minus that', 'over 2')
+    return [
+        {'From': '+1555%07d' % (i % phones), 'Body': messages[i // phones % len(messages)]}
+        for i in range(requests)
+    ]
+
+
+def try_decimal(word):
+    try:
+        return decimal.Decimal(word)
+    except decimal.InvalidOperation:
+        return None
+
+
+def word_cost(scan, words, rounds=200):
+    start = time.time()
+    for _ in range(rounds):
+        for word in words:
+            scan(word)
+    return (time.time() - start) / (rounds * len(words))
+
+
+class Lists(collections.defaultdict):
+    # The layout before sessions.Env, with no per-session settings.
+    __slots__ = ()
+    settings = {}
+
+
+def session_memory(new_sym2val, messages, phones):
+    script = ('1671', 'is fair', '108 times fair', 'over 7', 'is v%d', 'minus fair', 'round')
+    phone2sym2val = {}
+    tracemalloc.start()
+    for i in range(messages):
+        phone = i % phones
+        sym2val = phone2sym2val.get(phone)
+        if sym2val is None:
+            sym2val = phone2sym2val[phone] = new_sym2val()
+        message = script[i // phones % len(script)]
+        if '%d' in message:
+            message = message % (i // phones % 50)
+        simple.Program(sym2val=sym2val).message(message)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+def snapshot_cost(phones, directory, rounds=1000):
+    # One store of phones sessions, then what each way of keeping it across
+    # a restart costs: replaying the messages, a pickle of defaultdicts of
+    # Numbers, and a snapshot mapped at startup and paged in per phone.
+    import pickle
+    import snapshot
+    path = os.path.join(directory, 'sessions.snapshot')
+    script = ('1671', 'is fair', '303 is strike', '108 times strike', 'over fair', '108 minus that', 'over 2', 'is v')
+    messages = [('+1555%07d' % phone, message) for phone in range(phones) for message in script]
+    store = sessions.SessionStore(max_sessions=phones, text2value=simple.phone2env.text2value)
+    start = time.time()
+    for phone, message in messages:
+        simple.Program(sym2val=store.get(phone)).message(message)
+    replay = time.time() - start
+    phone2sym2val = {}
+    for phone in store.phones():
+        sym2val = phone2sym2val[phone] = collections.defaultdict(list)
+        sym2val.update(store.get(phone))
+    results = {'replay': (replay, 0, 0, 0)}
+    start = time.time()
+    with open(path + '.pickle', 'wb') as f:
+        pickle.dump(phone2sym2val, f, pickle.HIGHEST_PROTOCOL)
+    written = time.time() - start
+    start = time.time()
+    with open(path + '.pickle', 'rb') as f:
+        pickle.load(f)
+    results['pickle'] = (written, time.time() - start, 0, os.path.getsize(path + '.pickle'))
+    start = time.time()
+    store.save(path)
+    written = time.time() - start
+    start = time.time()
+    warm = sessions.SessionStore(max_sessions=phones, snapshot=snapshot.Snapshot(path), number2value=engine.Number)
+    opened = time.time() - start
+    start = time.time()
+    for i in range(rounds):
+        warm.get('+1555%07d' % (i * 7919 % phones))
+    results['snapshot'] = (written, opened, (time.time() - start) / rounds, os.path.getsize(path))
+    return results
+
+
+def chained(spec, phones, messages):
+    script = ('over 7', 'times 3.3', 'minus 0.017', 'over 1.9', 'times 2.2', 'over 1.3')
+    start = time.time()
+    for _ in range(phones):
+        program = simple.Program()
+        program.message(':numeric ' + spec)
+        program.message('1671')
+        for i in range(messages):
+            program.message(script[i % len(script)])
+    elapsed = time.time() - start
+    return phones * messages / elapsed, len(program.responses[-1])
+
+
+def model(symbols):
+    # Rows of a spreadsheet-like session: each row's input is scaled by the
+    # shared 'fair' and one row is a total built from the one before it.
+    messages = ['1671 is fair', '0 is t0']
+    for i in range(symbols):
+        messages.extend(['%d is a%d' % (100 + i, i), 'a%d times 108' % i, 'over fair', 'is b%d' % i])
+        messages.extend(['t%d minus b%d' % (i, i), 'is t%d' % (i + 1)])
+    return messages
+
+
+def rebind_cost(symbols, reactive, rounds=20):
+    program = simple.Program()
+    if reactive:
+        program.message(':reactive on')
+    messages = model(symbols)
+    for message in messages:
+        program.message(message)
+    row = symbols // 2
+    # Without reactive mode the user re-sends everything the row feeds.
+    resend = [] if reactive else messages[2 + 6 * row + 1:]
+    start = time.time()
+    for i in range(rounds):
+        program.message('%d is a%d' % (200 + i, row))
+        for message in resend:
+            program.message(message)
+    return (time.time() - start) / rounds, program.sym2val['t%d' % symbols][-1].number
+
+
+def sweep_cost(spec, points, rounds=5):
+    chain = ['108 times strike', 'over fair', '108 minus that', 'over 2', 'is premium', 'premium times fair', 'is cost']
+    program = simple.Program()
+    program.message(':numeric ' + spec)
+    program.message(':reactive on')
+    for message in ['1671 is fair', '303 is strike'] + chain:
+        program.message(message)
+    start = time.time()
+    for _ in range(rounds):
+        program.message('strike is 250 to %d step 1' % (250 + points - 1))
+    swept = (time.time() - start) / rounds
+    program = simple.Program()
+    program.message(':numeric ' + spec)
+    program.message('1671 is fair')
+    start = time.time()
+    for strike in range(250, 250 + points):
+        # One SMS round trip per candidate, as users do without sweeps.
+        program.message('%d is strike' % strike)
+        for message in chain:
+            program.message(message)
+    return (time.time() - start), swept
+
+
+def format_twiml(response):
+    return '''<?xml version="1.0" encoding="UTF-8"?>
+<Response>
+    <Message>
+        <Body>{0}</Body>
+    </Message>
+</Response>'''.format(response).encode('utf-8')
+
+
+def encode_cost(encode, responses, rounds=2000):
+    start = time.time()
+    for _ in range(rounds):
+        for response in responses:
+            encode(response)
+    return (time.time() - start) / (rounds * len(responses))
+
+
+def stress(threads, phones=16, messages=500, locked=True):
+    store = sessions.SessionStore()
+    for phone in range(phones):
+        with store.session(phone) as sym2val:
+            simple.Program(sym2val=sym2val).message('0')
+
+    def send(phone):
+        if locked:
+            with store.session(phone) as sym2val:
+                simple.Program(sym2val=sym2val).message('minus 1')
+        else:
+            sym2val = store.get(phone)
+            simple.Program(sym2val=sym2val).message('minus 1')
+            store.put(phone, sym2val)
+
+    def work():
+        for _ in range(messages):
+            for phone in range(phones):
+                send(phone)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+
+    expected = -threads * messages
+    lost = sum(expected - store.get(phone)['that'][-1].number for phone in range(phones))
+    return threads * messages * phones / elapsed, -lost
+
+
+def flask_webhook(forms):
+    import web
+    client = web.app.test_client()
+    latencies = []
+    start = time.time()
+    for form in forms:
+        before = time.time()
+        client.post('/message', data=form)
+        latencies.append(time.time() - before)
+    return latencies, time.time() - start
+
+
+def asgi_webhook(forms):
+    import asgi
+
+    async def receive_body(body):
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(event):
+        pass
+
+    async def drive():
+        latencies = []
+        for form in forms:
+            body = urlencode(form).encode('ascii')
+            scope = {'type': 'http', 'method': 'POST', 'path': '/message', 'query_string': b''}
+            before = time.time()
+            await asgi.app(scope, lambda: receive_body(body), send)
+            latencies.append(time.time() - before)
+        return latencies
+
+    start = time.time()
+    latencies = asyncio.run(drive())
+    return latencies, time.time() - start
+
+
+def retry_storm(messages, copies, sids, delay=0.002):
+    # Every message is delivered copies times at once, as a provider
+    # retrying a slow webhook would, against an evaluate that takes delay
+    # seconds, then once more later. Returns (seconds, evaluations).
+    import asgi
+    import idempotency
+    idempotency.replies = idempotency.ReplyCache()
+    simple.phone2env = sessions.SessionStore(text2value=simple.phone2env.text2value)
+    calls = [0]
+
+    async def slow_evaluate(phone, message, sid):
+        calls[0] += 1
+        await asyncio.sleep(delay)
+        return simple.reply(phone, message)
+
+    async def receive_body(body):
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(event):
+        pass
+
+    async def deliver(form):
+        body = urlencode(form).encode('ascii')
+        scope = {'type': 'http', 'method': 'POST', 'path': '/message', 'query_string': b''}
+        await app(scope, lambda: receive_body(body), send)
+
+    async def drive():
+        forms = [
+            {'From': '+1555%07d' % (i % 100), 'Body': '%d times 2' % i, 'MessageSid': 'SM%032d' % i if sids else ''}
+            for i in range(messages)
+        ]
+        for form in forms:
+            await asyncio.gather(*[deliver(form) for _ in range(copies)])
+        for form in forms:
+            await deliver(form)
+
+    app = asgi.make_app(slow_evaluate)
+    start = time.time()
+    asyncio.run(drive())
+    return time.time() - start, calls[0]
+
+
+def loadtest(url, forms, concurrency):
+    latencies = []
+    chunks = [forms[i::concurrency] for i in range(concurrency)]
+
+    def work(chunk):
+        for form in chunk:
+            before = time.time()
+            urlopen(url, urlencode(form).encode('ascii')).read()
+            latencies.append(time.time() - before)
+
+    workers = [threading.Thread(target=work, args=(chunk,)) for chunk in chunks]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, time.time() - start
+
+
+def post_forms(port, forms):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    for form in forms:
+        connection.request('POST', '/message', urlencode(form), headers)
+        connection.getresponse().read()
+    connection.close()
+    return len(forms)
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def shard_throughput(workers, forms, clients):
+    port = free_port()
+    launcher = subprocess.Popen(
+        [sys.executable, 'shards.py', '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port)],
+        cwd=os.path.dirname(os.path.abspath(simple.__file__)),
+    )
+    try:
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        time.sleep(0.5)
+        # Client processes, so the load generator is not one GIL either.
+        with multiprocessing.Pool(clients) as pool:
+            start = time.time()
+            sent = sum(pool.starmap(post_forms, [(port, forms[i::clients]) for i in range(clients)]))
+            return sent / (time.time() - start)
+    finally:
+        launcher.terminate()
+        launcher.wait()
+
+
+def overload_forms(requests, phones=100):
+    # Half the traffic from one phone flooding the service, the rest from
+    # ordinary phones.
+    forms = webhook_forms(requests // 2, phones)
+    flood = {'From': '+15559999999', 'Body': '1671 times 303 over 108 minus 2'}
+    return [form for pair in zip(forms, [flood] * len(forms)) for form in pair]
+
+
+OVERLOAD_SERVER = """
+import time, simple, web
+reply = simple.reply
+def slow_reply(phone, message):
+    start = time.time()
+    while time.time() - start < %f:
+        pass
+    return reply(phone, message)
+simple.reply = slow_reply
+web.app.run(host='127.0.0.1', port=%d, threaded=True)
+"""
+
+
+def overload(spec, forms, concurrency, cost):
+    # A threaded Flask server in its own process, with NOLANG_ADMISSION set
+    # to spec ('' for none) and every evaluation made to burn cost seconds
+    # of CPU, standing in for a heavy session. Returns (latencies, elapsed,
+    # admission stats).
+    port = free_port()
+    env = dict(os.environ, NOLANG_ADMISSION=spec)
+    server = subprocess.Popen(
+        [sys.executable, '-c', OVERLOAD_SERVER % (cost, port)],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port)).close()
+                break
+            except OSError:
+                time.sleep(0.05)
+        latencies, elapsed = loadtest('http://127.0.0.1:%d/message' % port, forms, concurrency)
+        stats = json.loads(urlopen('http://127.0.0.1:%d/metrics' % port).read().decode('utf-8'))
+        return latencies, elapsed, stats['admission']
+    finally:
+        server.terminate()
+        server.wait()
+
+
+ROOT = os.path.dirname(os.path.abspath(simple.__file__))
+# (module, how its command line is run) for each interpreter's CLI path.
+ENTRY_POINTS = (
+    ('nolang', ['nolang.py']),
+    ('simple', ['simple.py', '--repl']),
+    ('nois', ['nois.py']),
+)
+
+
+def import_time(module):
+    # The cumulative microseconds -X importtime reports for the module.
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=ROOT, stderr=subprocess.PIPE, universal_newlines=True,
+    )
+    for line in process.stderr.splitlines():
+        fields = line.split('|')
+        if 3 == len(fields) and module == fields[2].strip():
+            return int(fields[1])
+    raise ValueError('no import time for %s' % module)
+
+
+def imports(module, name):
+    process = subprocess.run(
+        [sys.executable, '-c', 'import sys, %s; print(%r in sys.modules)' % (module, name)],
+        cwd=ROOT, stdout=subprocess.PIPE, universal_newlines=True,
+    )
+    return 'True' == process.stdout.strip()
+
+
+def startup_time(argv, rounds=5):
+    # A whole short-lived process, with empty piped input so the REPL
+    # streams nothing and exits: the cost a batch job pays per spawn.
+    best = None
+    for _ in range(rounds):
+        start = time.time()
+        subprocess.run([sys.executable] + argv, cwd=ROOT, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+INTERPRETERS = """
+import json, sys
+sys.path[:0] = [%r, %r]
+from bench import suite, workloads
+results = {}
+for variant, new_send in (('nolang', suite.nolang_sender), ('simple', suite.simple_sender), ('nois', suite.nois_sender)):
+    for name, workload in sorted(workloads.workloads(%r).items()):
+        results['%%s/%%s' %% (variant, name)] = suite.measure(new_send, workload)['messages_per_second']
+print(json.dumps(results))
+"""
+
+
+def interpreter_rates(tree, scale):
+    # messages/s for each interpreter and workload, with the interpreter
+    # modules imported from tree and everything else, the bench included,
+    # from this checkout.
+    process = subprocess.run(
+        [sys.executable, '-c', INTERPRETERS % (tree, ROOT, scale)],
+        cwd=tree, stdout=subprocess.PIPE, check=True, universal_newlines=True,
+    )
+    return json.loads(process.stdout)
+
+
+def revision_rates(revision, scale):
+    # As interpreter_rates, for the tree at a git revision, e.g. the
+    # baseline commit, so a rewrite is measured against the code it
+    # replaced rather than a copy kept alive beside it.
+    tree = tempfile.mkdtemp()
+    try:
+        archive = subprocess.run(['git', 'archive', revision], cwd=ROOT, stdout=subprocess.PIPE, check=True).stdout
+        subprocess.run(['tar', '-x', '-C', tree], input=archive, check=True)
+        shutil.rmtree(os.path.join(tree, 'bench'), ignore_errors=True)
+        return interpreter_rates(tree, scale)
+    finally:
+        shutil.rmtree(tree)
+
+
+def main(args):
+    command = args[0]
+    if command == 'stress':
+        locked = '--unlocked' not in args
+        for threads in (1, 2, 4, 8, 16):
+            rate, lost = stress(threads, locked=locked)
+            print('threads=%d messages/s=%.0f lost=%d' % (threads, rate, lost))
+    elif command == 'words':
+        sample = '108 times strike over fair 108 minus that over 2 round is fair 1671 -3.5 1e3'.split()
+        for name, scan in (('try/except', try_decimal), ('lexer', lexer.classify), ('lexer cached', lexer.scan)):
+            print('%s ns/word=%.0f' % (name, 1e9 * word_cost(scan, sample)))
+    elif command == 'wordlist':
+        source = args[1] if len(args) > 1 else words.DICTIONARY
+        tracemalloc.start()
+        start = time.time()
+        with open(source) as f:
+            allwords = tuple(x.strip() for x in f)
+        print('tuple seconds=%.4f bytes=%d' % (time.time() - start, tracemalloc.get_traced_memory()[0]))
+        del allwords
+        tracemalloc.stop()
+        words.load(source)
+        words.path2wordlist.clear()
+        tracemalloc.start()
+        start = time.time()
+        allwords = words.load(source)
+        print('mmap seconds=%.4f bytes=%d' % (time.time() - start, tracemalloc.get_traced_memory()[0]))
+        tracemalloc.stop()
+    elif command == 'twiml':
+        responses = ['44', '19.58348294434470377019748654', "Sorry, I don't (yet) know what to do with 'a' and 'b' together"]
+        for name, encode in (('str.format', format_twiml), ('twiml', twiml.response2bytes)):
+            print('%s ns/response=%.0f' % (name, 1e9 * encode_cost(encode, responses)))
+        import flask
+        import web
+        with web.app.test_request_context():
+            for name, encode in (
+                ('make_response', lambda response: flask.make_response(format_twiml(response), 200)),
+                ('response_class', lambda response: web.app.response_class(
+                    twiml.response2bytes(response), status=200, content_type='text/xml',
+                )),
+            ):
+                print('%s ns/response=%.0f' % (name, 1e9 * encode_cost(encode, responses, rounds=200)))
+    elif command == 'memory':
+        messages = int(args[1]) if len(args) > 1 else 1000000
+        phones = int(args[2]) if len(args) > 2 else 100
+        for name, new_sym2val in (
+            ('lists', lambda: Lists(list)),
+            ('history', lambda: sessions.Env(sessions.MAX_HISTORY, record=False)),
+        ):
+            size = session_memory(new_sym2val, messages, phones)
+            print('%s bytes=%d bytes/phone=%d' % (name, size, size // phones))
+    elif command == 'snapshot':
+        phones = int(args[1]) if len(args) > 1 else 100000
+        directory = tempfile.mkdtemp()
+        try:
+            results = snapshot_cost(phones, directory)
+        finally:
+            shutil.rmtree(directory)
+        print('replay phones=%d seconds=%.2f' % (phones, results['replay'][0]))
+        for name in ('pickle', 'snapshot'):
+            written, started, paged, size = results[name]
+            print('%s phones=%d bytes/phone=%d write_ms=%.0f start_ms=%.1f page_in_us=%.0f' % (
+                name, phones, size // phones, 1000 * written, 1000 * started, 1e6 * paged,
+            ))
+    elif command == 'numeric':
+        messages = int(args[1]) if len(args) > 1 else 1000
+        for spec in sorted(numeric.TIERS):
+            rate, digits = chained(spec, 100, messages)
+            print('%s messages/s=%.0f digits=%d' % (spec, rate, digits))
+    elif command == 'shards':
+        requests = int(args[1]) if len(args) > 1 else 20000
+        forms = webhook_forms(requests, phones=1000)
+        cores = multiprocessing.cpu_count()
+        counts = sorted(set([1, cores] + [2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores]))
+        base = None
+        for workers in counts:
+            rate = shard_throughput(workers, forms, clients=max(2, workers))
+            base = base or rate
+            print('workers=%d requests/s=%.0f speedup=%.2f' % (workers, rate, rate / base))
+    elif command == 'aot':
+        messages = ('1671', 'is fair', '303', 'is strike', '108 times strike', 'over fair', '108 minus that', 'over 2', 'round')
+        rounds = 2000
+        start = time.time()
+        for _ in range(rounds):
+            translate.replay(messages, numeric.DEFAULT)
+        print('replay us/session=%.1f' % (1e6 * (time.time() - start) / rounds))
+        session = translate.load(messages)
+        inputs = {'fair': decimal.Decimal(1000)}
+        start = time.time()
+        for _ in range(rounds * 10):
+            session(inputs)
+        print('translated us/session=%.1f' % (1e6 * (time.time() - start) / (rounds * 10)))
+    elif command == 'reactive':
+        symbols = int(args[1]) if len(args) > 1 else 1000
+        for name, reactive in (('resend', False), ('reactive', True)):
+            seconds, last = rebind_cost(symbols, reactive)
+            print('%s ms/rebind=%.2f last=%s' % (name, 1000 * seconds, last))
+    elif command == 'revision' and len(args) > 1:
+        revision = args[1]
+        scale = float(args[2]) if len(args) > 2 else 0.1
+        old = revision_rates(revision, scale)
+        new = interpreter_rates(ROOT, scale)
+        for key in sorted(new):
+            if key in old:
+                print('%s %s messages/s=%.0f messages/s=%.0f speedup=%.2f' % (
+                    key, revision[:12], old[key], new[key], new[key] / old[key],
+                ))
+    elif command == 'sweep':
+        points = int(args[1]) if len(args) > 1 else 1000
+        for spec in ('exact', 'float'):
+            messages, swept = sweep_cost(spec, points)
+            print('%s points=%d messages_ms=%.1f sweep_ms=%.1f speedup=%.0f' % (
+                spec, points, 1000 * messages, 1000 * swept, messages / swept,
+            ))
+    elif command == 'retries':
+        messages = int(args[1]) if len(args) > 1 else 200
+        copies = int(args[2]) if len(args) > 2 else 5
+        import idempotency
+        for name, sids in (('without MessageSid', False), ('with MessageSid', True)):
+            elapsed, evaluations = retry_storm(messages, copies, sids)
+            print('%s deliveries=%d evaluations=%d seconds=%.2f %s' % (
+                name, messages * (copies + 1), evaluations, elapsed,
+                ' '.join('%s=%s' % item for item in sorted(idempotency.replies.stats().items())),
+            ))
+    elif command == 'startup':
+        for module, argv in ENTRY_POINTS:
+            print('%s import_us=%d startup_ms=%.1f flask=%s' % (
+                module,
+                import_time(module),
+                1000 * startup_time(argv),
+                imports(module, 'flask'),
+            ))
+    elif command == 'webhook':
+        forms = webhook_forms(20000)
+        report('flask', *flask_webhook(forms))
+        report('asgi', *asgi_webhook(forms))
+    elif command == 'overload':
+        concurrency = int(args[1]) if len(args) > 1 else 64
+        cost = float(args[2]) / 1000 if len(args) > 2 else 0.002
+        forms = overload_forms(4000)
+        for name, spec in (('open', ''), ('admission', 'rate=5,burst=20,workers=2,queue=8,deadline=0.05')):
+            latencies, elapsed, stats = overload(spec, forms, concurrency, cost)
+            shed = stats.get('shed', {})
+            report('%s concurrency=%d shed=%d' % (name, concurrency, sum(shed.values())), latencies, elapsed)
+            if shed:
+                print('  %s max_queue_depth=%d' % (
+                    ' '.join('%s=%d' % item for item in sorted(shed.items())), stats['max_queue_depth'],
+                ))
+    elif command == 'loadtest':
+        # Start e.g. `gunicorn -w 1 --threads 16 web:app` (or nois_web:app) or
+        # `uvicorn asgi:app` first, then point this at its /message URL.
+        url = args[1]
+        concurrency = int(args[2]) if len(args) > 2 else 16
+        report(url, *loadtest(url, webhook_forms(20000), concurrency))
+    else:
+        return False
+    return True
@@ -0,0 +1,208 @@
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import engine
+import lexer
+import nolang
+import nois
+import sessions
+import simple
+import words
+
+from bench import micro
+from bench import workloads
+
+ALLWORDS = tuple('word%d' % i for i in range(10000))
+THRESHOLD = 0.25
+# (metric, +1 when bigger is better, -1 when smaller is better)
+METRICS = (
+    ('messages_per_second', 1),
+    ('p99_us', -1),
+    ('bytes', -1),
+    ('import_us', -1),
+    ('startup_ms', -1),
+)
+
+
+def reset():
+    for dialect in engine.DIALECTS.values():
+        dialect.compiled = engine.LRUCache(engine.COMPILED_CACHE_SIZE)
+    lexer.word2token.clear()
+    random.seed(0)
+
+
+def nolang_sender():
+    phone2program = {}
+
+    def send(phone, message):
+        program = phone2program.get(phone)
+        if program is None:
+            program = phone2program[phone] = nolang.Program()
+        return program.message(message)
+    return send
+
+
+def env_sender(new_program):
+    phone2sym2val = {}
+
+    def send(phone, message):
+        sym2val = phone2sym2val.get(phone)
+        if sym2val is None:
+            sym2val = phone2sym2val[phone] = sessions.Env(sessions.MAX_HISTORY, record=False)
+        return new_program(sym2val).message(message)
+    return send
+
+
+def simple_sender():
+    return env_sender(lambda sym2val: simple.Program(sym2val=sym2val))
+
+
+def nois_sender():
+    return env_sender(lambda sym2val: nois.Program(allwords=ALLWORDS, sym2val=sym2val))
+
+
+def flask_sender(module, app):
+    def new_send():
+        module.phone2env = sessions.SessionStore(text2value=module.phone2env.text2value)
+        client = app.test_client()
+
+        def send(phone, message):
+            return client.post('/message', data={'From': phone, 'Body': message}).data
+        return send
+    return new_send
+
+
+def variants():
+    import nois_web
+    import web
+    found = [
+        ('nolang', nolang_sender, 1.0),
+        ('simple', simple_sender, 1.0),
+        ('nois', nois_sender, 1.0),
+        ('simple-flask', flask_sender(simple, web.app), 0.1),
+    ]
+    # The nois routes name results from the system dictionary.
+    if os.path.exists(words.DICTIONARY):
+        found.append(('nois-flask', flask_sender(nois, nois_web.app), 0.1))
+    return found
+
+
+def percentile(latencies, fraction):
+    return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+
+def measure(new_send, workload):
+    reset()
+    send = new_send()
+    clock = time.perf_counter
+    latencies = []
+    start = clock()
+    for phone, message in workload:
+        before = clock()
+        send(phone, message)
+        latencies.append(clock() - before)
+    elapsed = clock() - start
+    latencies.sort()
+
+    reset()
+    gc.collect()
+    tracemalloc.start()
+    send = new_send()
+    for phone, message in workload:
+        send(phone, message)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'messages': len(workload),
+        'seconds': elapsed,
+        'messages_per_second': len(workload) / elapsed,
+        'p50_us': 1e6 * percentile(latencies, 0.50),
+        'p99_us': 1e6 * percentile(latencies, 0.99),
+        'bytes': size,
+        'peak_bytes': peak,
+    }
+
+
+def run(scale):
+    scale2workloads = {}
+    results = {}
+    for variant, new_send, variant_scale in variants():
+        key = scale * variant_scale
+        if key not in scale2workloads:
+            scale2workloads[key] = workloads.workloads(key)
+        for name, workload in sorted(scale2workloads[key].items()):
+            result = results['%s/%s' % (variant, name)] = measure(new_send, workload)
+            sys.stderr.write('%-30s %9.0f msg/s  p50 %8.1fus  p99 %8.1fus  %10d bytes\n' % (
+                '%s/%s' % (variant, name),
+                result['messages_per_second'],
+                result['p50_us'],
+                result['p99_us'],
+                result['bytes'],
+            ))
+    for module, argv in micro.ENTRY_POINTS:
+        result = results['startup/%s' % module] = {
+            'import_us': micro.import_time(module),
+            'startup_ms': 1000 * micro.startup_time(argv),
+        }
+        sys.stderr.write('%-30s %9dus import  %8.1fms startup\n' % (
+            'startup/%s' % module,
+            result['import_us'],
+            result['startup_ms'],
+        ))
+    return results
+
+
+def regressions(results, baseline, threshold):
+    found = []
+    for key, metrics in sorted(results.items()):
+        old = baseline.get(key)
+        if old is None:
+            continue
+        for metric, direction in METRICS:
+            if not old.get(metric):
+                continue
+            change = (metrics[metric] - old[metric]) / float(old[metric])
+            if -direction * change > threshold:
+                found.append('%s %s %.4g -> %.4g (%+.0f%%)' % (key, metric, old[metric], metrics[metric], 100 * change))
+    return found
+
+
+def main(args):
+    scale = 0.1 if '--quick' in args else 1.0
+    if '--scale' in args:
+        scale = float(args[args.index('--scale') + 1])
+    threshold = THRESHOLD
+    if '--threshold' in args:
+        threshold = float(args[args.index('--threshold') + 1])
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': scale,
+        'results': run(scale),
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if '--output' in args:
+        with open(args[args.index('--output') + 1], 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    if '--baseline' in args:
+        with open(args[args.index('--baseline') + 1]) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != scale:
+            sys.stderr.write('baseline was recorded at scale %s, not %s\n' % (baseline.get('scale'), scale))
+        found = regressions(report['results'], baseline['results'], threshold)
+        for regression in found:
+            sys.stderr.write('REGRESSION %s\n' % regression)
+        if found:
+            return 1
+    return 0
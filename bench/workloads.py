@@ -0,0 +1,56 @@
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KISS = os.path.join(ROOT, 'kiss.txt')
+CHAIN = ('1671', 'is fair', 'times 1.0001', 'minus 3', 'over 7', 'times fair', 'round', 'over 3')
+
+
+def phone(i):
+    return '+1555%07d' % i
+
+
+def transcript(path=KISS):
+    with open(path) as f:
+        return [line[2:].strip() for line in f if line.startswith('> ')]
+
+
+def kiss(repeats, phones=10):
+    messages = transcript()
+    return [
+        (phone(p), message)
+        for _ in range(repeats)
+        for p in range(phones)
+        for message in messages
+    ]
+
+
+def long_session(messages):
+    return [(phone(0), CHAIN[i % len(CHAIN)]) for i in range(messages)]
+
+
+def fanout(phones, rounds=3):
+    messages = transcript()
+    return [
+        (phone(p), messages[r % len(messages)])
+        for r in range(rounds)
+        for p in range(phones)
+    ]
+
+
+def long_expression(messages, length=500):
+    words = ['1.0001']
+    for i in range(length // 2):
+        words.extend(('times', '1.0001') if i % 3 else ('minus', '0.5'))
+    expression = ' '.join(words)
+    return [(phone(i % 10), expression) for i in range(messages)]
+
+
+def workloads(scale=1.0):
+    def n(count):
+        return max(1, int(count * scale))
+    return {
+        'kiss': kiss(n(200)),
+        'long_session': long_session(n(50000)),
+        'fanout': fanout(n(20000)),
+        'long_expression': long_expression(n(500)),
+    }
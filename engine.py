@@ -0,0 +1,415 @@
+import collections
+import decimal
+import operator
+
+import lexer
+import metrics
+import numeric
+import sessions
+
+PUSH = lexer.NUMBER
+LOAD = lexer.IDENTIFIER
+MUL = lexer.TIMES
+DIV = lexer.OVER
+SUB = lexer.MINUS
+ROUND = lexer.ROUND
+BIND = lexer.IS
+KINDS = len(lexer.KIND_NAMES)
+
+EMPTY, SYMBOL, SYMBOL_IS, NUMBER, NUMBER_IS, TIMES, OVER, MINUS, ERROR = range(9)
+STATE_NAMES = ('empty', 'symbol', 'symbol-is', 'number', 'number-is', 'times', 'over', 'minus', 'error')
+
+COMPILED_CACHE_SIZE = 4096
+
+
+class LRUCache(object):
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.key2value = collections.OrderedDict()
+
+    def get(self, key):
+        try:
+            value = self.key2value.pop(key)
+        except KeyError:
+            return None
+        self.key2value[key] = value
+        return value
+
+    def put(self, key, value):
+        self.key2value.pop(key, None)
+        self.key2value[key] = value
+        while len(self.key2value) > self.maxsize:
+            try:
+                self.key2value.popitem(last=False)
+            except KeyError:
+                break
+
+
+class Number(object):
+    __slots__ = ('number',)
+
+    def __init__(self, number):
+        self.number = number
+
+
+class Operators(object):
+    # Decimal's own operators on the global context, which is how nolang.py
+    # and nois.py compute; simple.py uses a per-session numeric.Numeric.
+    times = staticmethod(operator.mul)
+    over = staticmethod(operator.truediv)
+    minus = staticmethod(operator.sub)
+    text = staticmethod(str)
+
+    @staticmethod
+    def integral(value):
+        return value.to_integral()
+
+
+OPERATORS = Operators()
+
+
+def lookup(word, sym2val, staged):
+    values = staged.get(word) or sym2val.get(word)
+    if values:
+        return values[-1]
+    return None
+
+
+# Transitions: each takes (arg, word, literal, sym2val, staged, numbers) and
+# returns the next (state, arg). arg is a Number in NUMBER and NUMBER_IS, a
+# bare value in TIMES, OVER and MINUS, a word in SYMBOL and SYMBOL_IS and the
+# message in ERROR.
+
+def empty_push(arg, word, literal, sym2val, staged, numbers):
+    return NUMBER, literal
+
+
+def empty_load(arg, word, literal, sym2val, staged, numbers):
+    number = lookup(word, sym2val, staged)
+    if number is not None:
+        return NUMBER, number
+    return SYMBOL, word
+
+
+def empty_bind(arg, word, literal, sym2val, staged, numbers):
+    #TODO: How do we handle this omission?
+    return ERROR, 'What is is?'
+
+
+def number_times(arg, word, literal, sym2val, staged, numbers):
+    return TIMES, arg.number
+
+
+def number_over(arg, word, literal, sym2val, staged, numbers):
+    return OVER, arg.number
+
+
+def number_minus(arg, word, literal, sym2val, staged, numbers):
+    return MINUS, arg.number
+
+
+def number_round(arg, word, literal, sym2val, staged, numbers):
+    return NUMBER, Number(numbers.integral(arg.number))
+
+
+def number_bind(arg, word, literal, sym2val, staged, numbers):
+    return NUMBER_IS, arg
+
+
+def number_error(arg, word, literal, sym2val, staged, numbers):
+    return ERROR, "I don't know what to do with the number %s and the word %s" % (str(arg.number), word)
+
+
+def times_push(arg, word, literal, sym2val, staged, numbers):
+    try:
+        return NUMBER, Number(numbers.times(arg, literal.number))
+    except decimal.InvalidOperation:
+        # 0 over 0, inf minus inf: no number, so treat the word as a name.
+        return times_load(arg, word, literal, sym2val, staged, numbers)
+
+
+def times_load(arg, word, literal, sym2val, staged, numbers):
+    right = lookup(word, sym2val, staged)
+    if right is None:
+        return ERROR, "I don't know how to multiply %s and %s" % (arg, word)
+    return NUMBER, Number(numbers.times(arg, right.number))
+
+
+def over_push(arg, word, literal, sym2val, staged, numbers):
+    try:
+        return NUMBER, Number(numbers.over(arg, literal.number))
+    except decimal.InvalidOperation:
+        # 0 over 0, inf minus inf: no number, so treat the word as a name.
+        return over_load(arg, word, literal, sym2val, staged, numbers)
+
+
+def over_load(arg, word, literal, sym2val, staged, numbers):
+    right = lookup(word, sym2val, staged)
+    if right is None:
+        return ERROR, "I don't know how to divide %s by %s" % (arg, word)
+    return NUMBER, Number(numbers.over(arg, right.number))
+
+
+def minus_push(arg, word, literal, sym2val, staged, numbers):
+    try:
+        return NUMBER, Number(numbers.minus(arg, literal.number))
+    except decimal.InvalidOperation:
+        # 0 over 0, inf minus inf: no number, so treat the word as a name.
+        return minus_load(arg, word, literal, sym2val, staged, numbers)
+
+
+def minus_load(arg, word, literal, sym2val, staged, numbers):
+    right = lookup(word, sym2val, staged)
+    if right is None:
+        return ERROR, "I don't know how to subtract %s from %s" % (word, arg)
+    return NUMBER, Number(numbers.minus(arg, right.number))
+
+
+def symbol_bind(arg, word, literal, sym2val, staged, numbers):
+    return SYMBOL_IS, arg
+
+
+def symbol_error(arg, word, literal, sym2val, staged, numbers):
+    #TODO: do we handle numbers differently?
+    return ERROR, "Sorry, I don't (yet) know what to do with '%s' and '%s' together" % (arg, word)
+
+
+def symbol_is_push(arg, word, literal, sym2val, staged, numbers):
+    staged.setdefault(arg, []).append(literal)
+    return NUMBER, literal #TODO: this prevents complex expressions
+
+
+def symbol_is_load(arg, word, literal, sym2val, staged, numbers):
+    number = lookup(word, sym2val, staged)
+    if number is None:
+        #TODO: can symbols point to symbols?
+        return ERROR, "Sorry, I don't want to point '%s' to '%s' when I don't know what '%s' means" % (arg, word, word)
+    staged.setdefault(arg, []).append(number)
+    return NUMBER, number
+
+
+def number_is_push(arg, word, literal, sym2val, staged, numbers):
+    return ERROR, "Sorry, I don't know how to make %s be %s" % (str(arg.number), str(literal.number))
+
+
+def number_is_load(arg, word, literal, sym2val, staged, numbers):
+    staged.setdefault(word, []).append(arg)
+    return NUMBER, arg
+
+
+def error(arg, word, literal, sym2val, staged, numbers):
+    return ERROR, arg
+
+
+def compile_words(words):
+    # Literals become Number objects here so every session that runs this
+    # cached code shares them rather than allocating its own copy.
+    return tuple(
+        (kind, word, Number(value) if PUSH == kind else value)
+        for kind, word, value in lexer.scan_words(words)
+    )
+
+
+def simple_numbers(sym2val):
+    return numeric.load(sym2val.settings.get('numeric', numeric.DEFAULT))
+
+
+def fixed_numbers(sym2val):
+    return OPERATORS
+
+
+class Dialect(object):
+    def __init__(self, name, transitions, defaults, lower=True, continues=(), atomic=True,
+                 empty=None, numbers=fixed_numbers, new_sym2val=None):
+        self.name = name
+        # Flattened to one tuple indexed by state * KINDS + kind, so a word
+        # costs one index and one call whatever state it arrives in.
+        self.table = tuple(
+            transitions.get((state, kind), defaults.get(state, error))
+            for state in range(len(STATE_NAMES))
+            for kind in range(KINDS)
+        )
+        if metrics.enabled:
+            self.table = metrics.transitions(self.table, STATE_NAMES, lexer.KIND_NAMES)
+        self.lower = lower
+        self.continues = frozenset(continues)
+        # Whether a failing message drops the bindings it made on the way.
+        self.atomic = atomic
+        # The reply to a message with no words, or None to say nothing.
+        self.empty = empty
+        self.numbers = numbers
+        self.new_sym2val = new_sym2val or (lambda: sessions.Env(sessions.MAX_HISTORY, record=False))
+        self.compiled = LRUCache(COMPILED_CACHE_SIZE)
+
+    def compile(self, message):
+        code = self.compiled.get(message)
+        if code is None:
+            words = message.lower().split() if self.lower else message.split()
+            text = ' '.join(words)
+            code = self.compiled.get(text)
+            if code is None:
+                code = compile_words(words)
+                self.compiled.put(text, code)
+            self.compiled.put(message, code)
+        return code
+
+    def execute(self, code, sym2val, numbers):
+        # Only an operator or 'is' can follow a number, so the first
+        # instruction alone decides whether this message continues 'that'.
+        # Bindings are staged, and an atomic dialect only lets them reach
+        # sym2val if no word fails.
+        table = self.table
+        staged = {}
+        that = sym2val.get('that')
+        if that and code[0][0] in self.continues:
+            state, arg = NUMBER, that[-1]
+        else:
+            state, arg = EMPTY, None
+        for kind, word, literal in code:
+            state, arg = table[state * KINDS + kind](arg, word, literal, sym2val, staged, numbers)
+            if ERROR == state:
+                break
+        if ERROR != state or not self.atomic:
+            for symbol, values in staged.items():
+                history = sym2val[symbol]
+                for value in values:
+                    history.append(value)
+        if NUMBER == state:
+            sym2val['that'].append(arg)
+        return state, arg
+
+
+def state2response(state, arg, numbers):
+    if NUMBER == state:
+        return numbers.text(arg.number)
+    elif ERROR == state:
+        return arg
+    elif SYMBOL == state:
+        return 'Symbol ' + arg
+    elif SYMBOL_IS == state:
+        return arg + ' is . . .'
+    elif NUMBER_IS == state:
+        return numbers.text(arg.number) + ' is . . .'
+    elif TIMES == state:
+        return numbers.text(arg) + ' times . . .'
+    elif OVER == state:
+        return numbers.text(arg) + ' over . . .'
+    elif MINUS == state:
+        return numbers.text(arg) + ' minus . . .'
+    else:
+        return 'Empty expression'
+
+
+SIMPLE_TRANSITIONS = {
+    (EMPTY, PUSH): empty_push,
+    (EMPTY, BIND): empty_bind,
+    (NUMBER, MUL): number_times,
+    (NUMBER, DIV): number_over,
+    (NUMBER, SUB): number_minus,
+    (NUMBER, ROUND): number_round,
+    (NUMBER, BIND): number_bind,
+    (TIMES, PUSH): times_push,
+    (OVER, PUSH): over_push,
+    (MINUS, PUSH): minus_push,
+    (SYMBOL, BIND): symbol_bind,
+    (SYMBOL_IS, PUSH): symbol_is_push,
+    (NUMBER_IS, PUSH): number_is_push,
+}
+SIMPLE_DEFAULTS = {
+    EMPTY: empty_load,
+    NUMBER: number_error,
+    TIMES: times_load,
+    OVER: over_load,
+    MINUS: minus_load,
+    SYMBOL: symbol_error,
+    SYMBOL_IS: symbol_is_load,
+    NUMBER_IS: number_is_load,
+}
+
+SIMPLE = Dialect(
+    'simple',
+    SIMPLE_TRANSITIONS,
+    SIMPLE_DEFAULTS,
+    continues=(MUL, DIV, SUB, ROUND, BIND),
+    numbers=simple_numbers,
+)
+
+# nolang.py: case-sensitive, never continues 'that', no 'round' and no
+# 'number is name'; a binding stays made even if a later word fails.
+NOLANG = Dialect(
+    'nolang',
+    dict(
+        (key, transition) for key, transition in SIMPLE_TRANSITIONS.items()
+        if key not in ((NUMBER, ROUND), (NUMBER, BIND))
+    ),
+    SIMPLE_DEFAULTS,
+    lower=False,
+    atomic=False,
+    empty='Empty expression',
+    new_sym2val=lambda: collections.defaultdict(list),
+)
+
+# nois.py: no 'is' at all; nois.Program files every result under a random word.
+NOIS = Dialect(
+    'nois',
+    {
+        (EMPTY, PUSH): empty_push,
+        (NUMBER, MUL): number_times,
+        (NUMBER, DIV): number_over,
+        (NUMBER, SUB): number_minus,
+        (NUMBER, ROUND): number_round,
+        (TIMES, PUSH): times_push,
+        (OVER, PUSH): over_push,
+        (MINUS, PUSH): minus_push,
+    },
+    {
+        EMPTY: empty_load,
+        NUMBER: number_error,
+        TIMES: times_load,
+        OVER: over_load,
+        MINUS: minus_load,
+        SYMBOL: symbol_error,
+    },
+    continues=(MUL, DIV, SUB, ROUND),
+)
+
+DIALECTS = dict((dialect.name, dialect) for dialect in (NOLANG, SIMPLE, NOIS))
+
+
+class Program(object):
+    # One session's interpreter. nolang.py, simple.py and nois.py each
+    # subclass it with their dialect, and may override evaluate.
+    dialect = SIMPLE
+
+    def __init__(self, sym2val=None):
+        self.messages = []
+        self.responses = []
+        if sym2val is None:
+            self.sym2val = self.dialect.new_sym2val()
+        else:
+            self.sym2val = sym2val
+
+    def message(self, message):
+        dialect = self.dialect
+        code = dialect.compile(message)
+        if len(code) == 0:
+            if dialect.empty is None:
+                return ''
+            response = dialect.empty
+        else:
+            state, arg, response = self.evaluate(message, code, dialect.numbers(self.sym2val))
+
+        self.messages.append(message)
+        self.responses.append(response)
+
+        return response
+
+    def evaluate(self, message, code, numbers):
+        state, arg = self.dialect.execute(code, self.sym2val, numbers)
+        return state, arg, state2response(state, arg, numbers)
+
+
+if metrics.enabled:
+    Dialect.compile = metrics.stage('compile', Dialect.compile)
+    Dialect.execute = metrics.stage('evaluate', Dialect.execute)
+    state2response = metrics.stage('respond', state2response)
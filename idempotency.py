@@ -0,0 +1,137 @@
+import collections
+import threading
+import time
+
+# Twilio retries a webhook that has not answered within 15 seconds, a few
+# times over a few minutes; a reply is kept well past the last retry.
+TTL = 15 * 60
+MAX_ENTRIES = 100000
+
+PENDING, DONE, FAILED, DECLINED = range(4)
+
+clock = getattr(time, 'monotonic', time.time)
+
+
+class Entry(object):
+    __slots__ = ('state', 'value', 'expires', 'futures')
+
+    def __init__(self, expires):
+        self.state = PENDING
+        self.value = None
+        self.expires = expires
+        self.futures = []
+
+
+def resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ReplyCache(object):
+    # Replies keyed on the provider's message id (MessageSid). The first
+    # request for an id computes the reply; a retry gets the stored value
+    # and a duplicate that arrives while the first is still running waits
+    # for it, so a message is evaluated once however often it is delivered.
+    def __init__(self, ttl=TTL, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.finished = threading.Condition(self.lock)
+        # Insertion order is expiry order, since every entry gets the same TTL.
+        self.key2entry = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.expired = 0
+        self.evicted = 0
+        self.failures = 0
+        self.declined = 0
+
+    def begin(self, key):
+        # Called with the lock held. Returns the entry and whether the
+        # caller is the one that has to compute it.
+        now = clock()
+        while self.key2entry:
+            oldest = next(iter(self.key2entry.values()))
+            if oldest.expires <= now:
+                self.expired += 1
+            elif len(self.key2entry) > self.max_entries:
+                self.evicted += 1
+            else:
+                break
+            self.key2entry.popitem(last=False)
+        entry = self.key2entry.get(key)
+        if entry is None:
+            entry = self.key2entry[key] = Entry(now + self.ttl)
+            self.misses += 1
+            return entry, True
+        if DONE == entry.state:
+            self.hits += 1
+        else:
+            self.waits += 1
+        return entry, False
+
+    def end(self, key, entry, state, value=None):
+        with self.lock:
+            entry.state = state
+            entry.value = value
+            if FAILED == state:
+                self.failures += 1
+            elif DECLINED == state:
+                # Turned away before it ran: not a miss after all.
+                self.misses -= 1
+                self.declined += 1
+            if DONE != state:
+                # Waiters go round again and one of them retries.
+                if self.key2entry.get(key) is entry:
+                    del self.key2entry[key]
+            futures = entry.futures
+            entry.futures = []
+            self.finished.notify_all()
+        # Futures of coroutines waiting in asgi.cached.
+        for future in futures:
+            future.get_loop().call_soon_threadsafe(resolve, future)
+
+    def compute(self, key, function, declined=()):
+        # Exceptions of the declined types, such as admission.Busy, are
+        # neither cached nor counted as failures.
+        if not key:
+            return function()
+        while True:
+            with self.lock:
+                entry, first = self.begin(key)
+                if not first:
+                    while PENDING == entry.state:
+                        self.finished.wait()
+                    if DONE == entry.state:
+                        return entry.value
+                    continue
+            break
+        try:
+            value = function()
+        except declined:
+            self.end(key, entry, DECLINED)
+            raise
+        except BaseException:
+            self.end(key, entry, FAILED)
+            raise
+        self.end(key, entry, DONE, value)
+        return value
+
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses + self.waits
+            return {
+                'entries': len(self.key2entry),
+                'hits': self.hits,
+                'misses': self.misses,
+                'waits': self.waits,
+                'expired': self.expired,
+                'evicted': self.evicted,
+                'failures': self.failures,
+                'declined': self.declined,
+                'hit_rate': float(self.hits + self.waits) / requests if requests else 0.0,
+            }
+
+
+replies = ReplyCache()
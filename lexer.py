@@ -0,0 +1,66 @@
+import decimal
+import re
+import sys
+
+import metrics
+
+NUMBER, IDENTIFIER, TIMES, OVER, MINUS, ROUND, IS = range(7)
+KIND_NAMES = ('number', 'identifier', 'times', 'over', 'minus', 'round', 'is')
+SCAN_CACHE_SIZE = 65536
+
+intern = getattr(sys, 'intern', None) or intern
+KEYWORD2KIND = dict((intern(keyword), kind) for keyword, kind in (
+    ('times', TIMES),
+    ('over', OVER),
+    ('minus', MINUS),
+    ('round', ROUND),
+    ('is', IS),
+))
+
+LITERAL = re.compile(r'[+-]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][+-]?[0-9]+)?\Z')
+# Anything Decimal reads starts, after an optional sign, with a digit
+# (str.isdigit also covers non-ASCII ones) or a point, or else is one of
+# its special spellings, matched whole so words like 'nancy' are not tried.
+SIGNS = frozenset('+-')
+DIGITS = frozenset('0123456789.')
+SPECIAL_START = frozenset('iInNsS')
+SPECIAL = re.compile(r'[+-]?(?:inf(?:inity)?|s?nan[0-9_]*)\Z', re.IGNORECASE)
+
+
+word2token = {}
+
+
+def classify(word):
+    kind = KEYWORD2KIND.get(word)
+    if kind is not None:
+        return kind, word, None
+    # Words come from str.split(), so never empty.
+    head = word[0]
+    if head in SIGNS:
+        head = word[1:2]
+    if head in DIGITS or head.isdigit() or (head in SPECIAL_START and SPECIAL.match(word)):
+        # Decimal parses the word once; only the rare near miss ('-x',
+        # '1st') pays for the exception.
+        try:
+            return NUMBER, word, decimal.Decimal(word)
+        except decimal.InvalidOperation:
+            pass
+    return IDENTIFIER, word, None
+
+
+def scan(word):
+    token = word2token.get(word)
+    if token is None:
+        token = classify(word)
+        if len(word2token) >= SCAN_CACHE_SIZE:
+            word2token.clear()
+        word2token[word] = token
+    return token
+
+
+def scan_words(words):
+    return [scan(word) for word in words]
+
+
+if metrics.enabled:
+    scan_words = metrics.stage('tokenize', scan_words)
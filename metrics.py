@@ -0,0 +1,134 @@
+import collections
+import functools
+import json
+import os
+import threading
+import time
+
+# Read once at import: when disabled nothing below is ever wrapped around
+# the interpreter, so the hot path is exactly the uninstrumented code.
+enabled = os.environ.get('NOLANG_METRICS', '') not in ('', '0')
+
+ERROR_PREFIXES = (
+    ('What is is?', 'what-is-is'),
+    ("Sorry, I don't (yet) know what to do with", 'symbol-then-word'),
+    ("Sorry, I don't want to point", 'unknown-binding'),
+    ("Sorry, I don't know how to make", 'rebind-number'),
+    ("I don't know what to do with the number", 'number-then-word'),
+    ("I don't know how to multiply", 'unknown-multiplicand'),
+    ("I don't know how to divide", 'unknown-divisor'),
+    ("I don't know how to subtract", 'unknown-subtrahend'),
+)
+
+clock = getattr(time, 'perf_counter', time.time)
+lock = threading.Lock()
+stage2count = collections.defaultdict(int)
+stage2seconds = collections.defaultdict(float)
+transition2count = collections.defaultdict(int)
+transition2seconds = collections.defaultdict(float)
+error2count = collections.defaultdict(int)
+symbols = {'count': 0, 'total': 0, 'max': 0}
+
+
+def category(response):
+    for prefix, name in ERROR_PREFIXES:
+        if response.startswith(prefix):
+            return name
+    return None
+
+
+def record_stage(name, seconds):
+    with lock:
+        stage2count[name] += 1
+        stage2seconds[name] += seconds
+
+
+def record_transition(state, kind, seconds):
+    key = '%s/%s' % (state, kind)
+    with lock:
+        transition2count[key] += 1
+        transition2seconds[key] += seconds
+
+
+def record_message(response, size):
+    name = category(response)
+    with lock:
+        if name is not None:
+            error2count[name] += 1
+        symbols['count'] += 1
+        symbols['total'] += size
+        symbols['max'] = max(symbols['max'], size)
+
+
+def stage(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = clock()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record_stage(name, clock() - start)
+    return wrapper
+
+
+def message(function):
+    @functools.wraps(function)
+    def wrapper(self, text):
+        start = clock()
+        response = function(self, text)
+        record_stage('message', clock() - start)
+        record_message(response, len(self.sym2val))
+        return response
+    return wrapper
+
+
+def transitions(table, state_names, kind_names):
+    # table is indexed by state * len(kind_names) + kind, as engine.Dialect
+    # lays it out; each entry is timed under its state and word kind.
+    kinds = len(kind_names)
+
+    def wrap(function, state, kind):
+        @functools.wraps(function)
+        def wrapper(*args):
+            start = clock()
+            result = function(*args)
+            record_transition(state, kind, clock() - start)
+            return result
+        return wrapper
+    return tuple(
+        wrap(function, state_names[index // kinds], kind_names[index % kinds])
+        for index, function in enumerate(table)
+    )
+
+
+def snapshot():
+    with lock:
+        messages = stage2count.get('message', 0)
+        return {
+            'enabled': enabled,
+            'messages': messages,
+            'stages': dict(
+                (name, {'count': count, 'seconds': stage2seconds[name]})
+                for name, count in stage2count.items()
+            ),
+            'transitions': dict(
+                (key, {'count': count, 'seconds': transition2seconds[key]})
+                for key, count in transition2count.items()
+            ),
+            'errors': dict(
+                (name, {'count': count, 'rate': float(count) / messages if messages else 0.0})
+                for name, count in error2count.items()
+            ),
+            'symbols': dict(symbols),
+        }
+
+
+def dump():
+    return json.dumps(snapshot(), indent=2, sort_keys=True)
+
+
+def reset():
+    with lock:
+        for table in (stage2count, stage2seconds, transition2count, transition2seconds, error2count):
+            table.clear()
+        symbols.update(count=0, total=0, max=0)
@@ -0,0 +1,4 @@
+import nois
+import webhook
+
+app = webhook.make_app(nois)
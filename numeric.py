@@ -0,0 +1,152 @@
+import decimal
+import os
+
+ROUNDINGS = {
+    'half-even': decimal.ROUND_HALF_EVEN,
+    'half-up': decimal.ROUND_HALF_UP,
+    'half-down': decimal.ROUND_HALF_DOWN,
+    'up': decimal.ROUND_UP,
+    'down': decimal.ROUND_DOWN,
+    'ceiling': decimal.ROUND_CEILING,
+    'floor': decimal.ROUND_FLOOR,
+    '05up': decimal.ROUND_05UP,
+}
+MODES = ('decimal', 'fixed', 'float')
+MAX_PRECISION = 100
+CACHE_SIZE = 1024
+# Doubles carry 15-17 significant digits; asking for more just prints noise.
+FLOAT_DIGITS = 17
+
+TIERS = {
+    'exact': {},
+    'short': {'precision': 12, 'places': 2},
+    'cents': {'mode': 'fixed', 'places': 2, 'rounding': 'half-up'},
+    'float': {'mode': 'float', 'precision': 15},
+}
+
+
+def float_times(left, right):
+    return float(left) * float(right)
+
+
+def float_over(left, right):
+    return float(left) / float(right)
+
+
+def float_minus(left, right):
+    return float(left) - float(right)
+
+
+def float_integral(value):
+    return float(round(float(value)))
+
+
+class Numeric(object):
+    def __init__(self, precision=28, rounding='half-even', places=None, mode='decimal'):
+        if rounding not in ROUNDINGS:
+            raise ValueError('unknown rounding %r' % rounding)
+        if mode not in MODES:
+            raise ValueError('unknown mode %r' % mode)
+        if not 1 <= precision <= MAX_PRECISION:
+            raise ValueError('precision must be between 1 and %d' % MAX_PRECISION)
+        if places is not None and not 0 <= places <= precision:
+            raise ValueError('places must be between 0 and the precision')
+        if 'fixed' == mode and places is None:
+            places = 2
+        self.precision = precision
+        self.rounding = rounding
+        self.places = places
+        self.mode = mode
+        self.context = decimal.Context(prec=precision, rounding=ROUNDINGS[rounding])
+        self.quantum = None if places is None else decimal.Decimal(1).scaleb(-places)
+        if 'float' == mode:
+            self.times = float_times
+            self.over = float_over
+            self.minus = float_minus
+            self.integral = float_integral
+        elif 'fixed' == mode:
+            self.times = lambda left, right: self.fix(self.context.multiply(left, right))
+            self.over = lambda left, right: self.fix(self.context.divide(left, right))
+            self.minus = lambda left, right: self.fix(self.context.subtract(left, right))
+            self.integral = lambda value: self.fix(self.context.to_integral_value(value))
+        else:
+            # Bound context methods: the default tier costs one C call per
+            # operation, just like the operators on the global context.
+            self.times = self.context.multiply
+            self.over = self.context.divide
+            self.minus = self.context.subtract
+            self.integral = self.context.to_integral_value
+
+    def fix(self, value):
+        try:
+            return value.quantize(self.quantum, context=self.context)
+        except decimal.InvalidOperation:
+            # Too many digits to keep at this many places, or infinite: keep
+            # the value as computed, as text() shows it.
+            return value
+
+    def coerce(self, value):
+        if isinstance(value, float) and 'float' != self.mode:
+            return decimal.Decimal(repr(value))
+        return value
+
+    def text(self, value):
+        if isinstance(value, float):
+            if self.places is not None:
+                return '%.*f' % (self.places, value)
+            return '%.*g' % (min(self.precision, FLOAT_DIGITS), value)
+        if self.quantum is not None:
+            try:
+                return str(value.quantize(self.quantum, context=self.context))
+            except decimal.InvalidOperation:
+                # Too many digits to show at this many places.
+                pass
+        return str(value)
+
+    def spec(self):
+        items = ['precision=%d' % self.precision, 'rounding=%s' % self.rounding]
+        if self.places is not None:
+            items.append('places=%d' % self.places)
+        items.append('mode=%s' % self.mode)
+        return ','.join(items)
+
+
+spec2numeric = {}
+
+
+def parse(spec):
+    # A spec is a comma separated list of tier names and key=value
+    # overrides, e.g. 'cents' or 'short,rounding=half-up' or 'mode=float'.
+    options = {}
+    for item in spec.replace(' ', ',').split(','):
+        if not item:
+            continue
+        key, equals, value = item.partition('=')
+        if not equals:
+            if key not in TIERS:
+                raise ValueError('unknown tier %r' % key)
+            options.update(TIERS[key])
+        elif key in ('precision', 'places'):
+            try:
+                options[key] = int(value)
+            except ValueError:
+                raise ValueError('%s must be a whole number, not %r' % (key, value))
+        elif key in ('rounding', 'mode'):
+            options[key] = value
+        else:
+            raise ValueError('unknown setting %r' % key)
+    return Numeric(**options)
+
+
+def load(spec):
+    numeric = spec2numeric.get(spec)
+    if numeric is None:
+        numeric = parse(spec or '')
+        if len(spec2numeric) >= CACHE_SIZE:
+            spec2numeric.clear()
+        spec2numeric[spec] = numeric
+    return numeric
+
+
+DEFAULT = os.environ.get('NOLANG_NUMERIC', '')
+load(DEFAULT)
@@ -0,0 +1,236 @@
+import collections
+
+import engine
+import translate
+
+MAX_REPORTED = 5
+# Deeper 'that' formulas are dropped, so the next message continues from
+# the value alone and a long 'times 2' run stays cheap per message.
+MAX_DEPTH = 64
+
+
+class Reference(object):
+    __slots__ = ('symbol',)
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+
+
+class Shadow(dict):
+    # Stands in for a session while engine.SIMPLE.execute runs symbolically:
+    # bound symbols read as references to themselves, so what a message binds
+    # comes out as a formula over the symbols it used. 'that' is not a symbol
+    # users rebind, so its formula is inlined instead of referenced.
+    def __init__(self, sym2val, graph):
+        dict.__init__(self)
+        self.sym2val = sym2val
+        self.graph = graph
+
+    def get(self, word, default=None):
+        if word in self:
+            return dict.__getitem__(self, word)
+        values = self.sym2val.get(word)
+        if not values:
+            return default
+        if 'that' != word:
+            return [engine.Number(Reference(word))]
+        if self.graph.that is not None:
+            return [engine.Number(self.graph.that)]
+        return [engine.Number(translate.Literal(values[-1].number))]
+
+    def __missing__(self, symbol):
+        values = self[symbol] = []
+        return values
+
+
+def measure(formula, node2measure):
+    # (symbols referenced, depth) for formula. Nodes already in
+    # node2measure are not walked again, so the old 'that' formula a
+    # continuing message builds on costs one lookup, not its whole chain.
+    stack = [formula]
+    while stack:
+        node = stack[-1]
+        if id(node) in node2measure:
+            stack.pop()
+            continue
+        if isinstance(node, Reference):
+            result = (frozenset([node.symbol]), 1)
+        elif isinstance(node, translate.Operation):
+            pending = [operand for operand in node.operands if id(operand) not in node2measure]
+            if pending:
+                stack.extend(pending)
+                continue
+            operands = [node2measure[id(operand)] for operand in node.operands]
+            result = (
+                frozenset().union(*[symbols for symbols, _ in operands]),
+                1 + max(depth for _, depth in operands),
+            )
+        else:
+            result = (frozenset(), 1)
+        node2measure[id(node)] = result
+        stack.pop()
+    return node2measure[id(formula)]
+
+
+def evaluate(formula, sym2val, numbers):
+    # Iterative, because continuing 'that' message after message nests
+    # formulas deeper than Python's recursion limit; shared nodes are
+    # computed once.
+    node2value = {}
+    stack = [formula]
+    while stack:
+        node = stack[-1]
+        if id(node) in node2value:
+            stack.pop()
+            continue
+        if isinstance(node, Reference):
+            value = sym2val[node.symbol][-1].number
+        elif isinstance(node, translate.Literal):
+            value = node.value
+        else:
+            pending = [operand for operand in node.operands if id(operand) not in node2value]
+            if pending:
+                stack.extend(pending)
+                continue
+            value = getattr(numbers, node.operation)(*[node2value[id(operand)] for operand in node.operands])
+        node2value[id(node)] = value
+        stack.pop()
+    return node2value[id(formula)]
+
+
+class Graph(object):
+    def __init__(self):
+        self.symbol2formula = {}
+        self.symbol2inputs = {}
+        self.symbol2dependents = collections.defaultdict(set)
+        self.that = None
+        self.that_inputs = frozenset()
+        self.that_depth = 0
+
+    def depends(self, inputs, symbol):
+        # Searched downstream from the symbol rather than upstream from its
+        # inputs: a freshly bound symbol has no dependents, so this is free.
+        if symbol in inputs:
+            return True
+        seen = set()
+        stack = [symbol]
+        while stack:
+            for dependent in self.symbol2dependents.get(stack.pop(), ()):
+                if dependent in inputs:
+                    return True
+                if dependent not in seen:
+                    seen.add(dependent)
+                    stack.append(dependent)
+        return False
+
+    def bind(self, symbol, formula, inputs):
+        for input in self.symbol2inputs.pop(symbol, ()):
+            self.symbol2dependents[input].discard(symbol)
+        self.symbol2formula.pop(symbol, None)
+        # A symbol computed from its own old value ('times 2', 'is x') keeps
+        # the result but not the formula: following it would be a cycle.
+        if not inputs or self.depends(inputs, symbol):
+            return
+        self.symbol2formula[symbol] = formula
+        self.symbol2inputs[symbol] = inputs
+        for input in inputs:
+            self.symbol2dependents[input].add(symbol)
+
+    def downstream(self, roots):
+        affected = set()
+        stack = list(roots)
+        while stack:
+            for dependent in self.symbol2dependents.get(stack.pop(), ()):
+                if dependent not in affected and dependent not in roots:
+                    affected.add(dependent)
+                    stack.append(dependent)
+        # Kahn's algorithm over just the affected part of the graph.
+        waiting = dict(
+            (symbol, len(self.symbol2inputs[symbol] & affected))
+            for symbol in affected
+        )
+        ready = sorted(symbol for symbol, count in waiting.items() if 0 == count)
+        order = []
+        while ready:
+            symbol = ready.pop()
+            order.append(symbol)
+            for dependent in self.symbol2dependents.get(symbol, ()):
+                if dependent in waiting:
+                    waiting[dependent] -= 1
+                    if 0 == waiting[dependent]:
+                        ready.append(dependent)
+        return order
+
+    def continue_that(self, formula, inputs, depth):
+        if depth > MAX_DEPTH:
+            self.forget_that()
+        else:
+            self.that = formula
+            self.that_inputs = inputs
+            self.that_depth = depth
+
+    def forget_that(self):
+        self.that = None
+        self.that_inputs = frozenset()
+        self.that_depth = 0
+
+    def recompute(self, roots, sym2val, numbers):
+        # Only symbols downstream of a rebind are visited, each once, in
+        # dependency order; one whose inputs all came out unchanged keeps
+        # its value without being evaluated.
+        changed = set(roots)
+        updated = []
+        for symbol in self.downstream(changed):
+            if not self.symbol2inputs[symbol] & changed:
+                continue
+            try:
+                value = evaluate(self.symbol2formula[symbol], sym2val, numbers)
+            except ArithmeticError:
+                continue
+            history = sym2val[symbol]
+            old = history[-1].number
+            if value != old or str(value) != str(old):
+                history.append(engine.Number(value))
+                changed.add(symbol)
+                updated.append(symbol)
+        return updated
+
+
+def execute(code, sym2val, numbers):
+    if sym2val.graph is None:
+        sym2val.graph = Graph()
+    graph = sym2val.graph
+    # Trace before running: the real run binds symbols, and a bound symbol
+    # would steer the trace down a different path.
+    shadow = Shadow(sym2val, graph)
+    engine.SIMPLE.execute(translate.symbolic_code(code), shadow, translate.Symbolic(0))
+    state, arg = engine.SIMPLE.execute(code, sym2val, numbers)
+    if engine.ERROR == state:
+        return state, arg, []
+    node2measure = {}
+    if graph.that is not None:
+        node2measure[id(graph.that)] = (graph.that_inputs, graph.that_depth)
+    roots = []
+    for symbol, values in shadow.items():
+        if not values:
+            continue
+        formula = values[-1].number
+        inputs, depth = measure(formula, node2measure)
+        if 'that' == symbol:
+            graph.continue_that(formula, inputs, depth)
+        else:
+            graph.bind(symbol, formula, inputs)
+            roots.append(symbol)
+    updated = graph.recompute(roots, sym2val, numbers)
+    # An older 'that' over a symbol that has since moved would no longer
+    # match its value; fall back to the value itself.
+    stale = set(updated) if 'that' in shadow else set(updated) | set(roots)
+    if graph.that_inputs & stale:
+        graph.forget_that()
+    return state, arg, updated
+
+
+def describe(updated):
+    if len(updated) > MAX_REPORTED:
+        return ' (updated %s and %d more)' % (', '.join(updated[:MAX_REPORTED]), len(updated) - MAX_REPORTED)
+    return ' (updated %s)' % ', '.join(updated)
@@ -0,0 +1,97 @@
+from __future__ import print_function
+
+import json
+import sys
+import time
+
+import metrics
+
+try:
+    read_line = raw_input
+except NameError:
+    read_line = input
+
+# Piped input is read this many bytes at a time and responses are written
+# this many at a time, so a large message file costs a handful of system
+# calls rather than two per line.
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 512
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def interactive(program):
+    while True:
+        try:
+            message = read_line('> ')
+        except EOFError:
+            break
+        except KeyboardInterrupt:
+            print()
+            continue
+        if ':metrics' == message.strip():
+            print(metrics.dump())
+            continue
+        print(program.message(message))
+
+
+def read_messages(f, chunk_size=CHUNK_SIZE):
+    rest = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    if rest:
+        yield rest.rstrip('\r')
+
+
+def respond(program, messages):
+    for message in messages:
+        if ':metrics' == message.strip():
+            yield message, metrics.dump(), 0.0
+            continue
+        start = clock()
+        response = program.message(message)
+        yield message, response, clock() - start
+
+
+def as_text(results):
+    for message, response, seconds in results:
+        yield response + '\n'
+
+
+def as_jsonl(results):
+    for message, response, seconds in results:
+        yield json.dumps({'message': message, 'response': response, 'seconds': seconds}) + '\n'
+
+
+def write_batches(f, lines, batch_size=BATCH_SIZE):
+    batch = []
+    try:
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= batch_size:
+                f.write(''.join(batch))
+                del batch[:]
+    finally:
+        # Replies to the messages before one that raised still go out.
+        f.write(''.join(batch))
+        f.flush()
+
+
+def stream(program, source, target, jsonl=False):
+    results = respond(program, read_messages(source))
+    write_batches(target, as_jsonl(results) if jsonl else as_text(results))
+
+
+def main(program, argv):
+    # A terminal gets the prompt; anything else (a pipe, a file) is streamed
+    # without one, unless --interactive asks for the prompt regardless.
+    if '--interactive' in argv or (sys.stdin.isatty() and '--jsonl' not in argv):
+        interactive(program)
+    else:
+        stream(program, sys.stdin, sys.stdout, jsonl='--jsonl' in argv)
@@ -0,0 +1,245 @@
+import collections
+import decimal
+import itertools
+import math
+import multiprocessing
+import re
+import sys
+import time
+
+SESSIONS_PER_TASK = 100
+IN_FLIGHT = 4
+MAX_DIFFS = 20
+# Latencies are kept as a log-scale histogram rather than a list, so a run
+# over millions of lines stays small and workers' results simply add up.
+BUCKETS_PER_OCTAVE = 8
+PERCENTILES = (0.50, 0.90, 0.99, 0.999)
+
+ASSIGNMENT = re.compile(r'([^\s=]+)\s*=\s*(.+)\Z')
+OPERATION = re.compile(r'(\S+)\s*([*/-])\s*(\S+)\Z')
+DECIMAL = re.compile(r'Decimal\((.*)\)\Z')
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Session(object):
+    __slots__ = ('path', 'line', 'exchanges', 'rendering')
+
+    def __init__(self, path, line):
+        self.path = path
+        self.line = line
+        # (line number, input, expected output lines)
+        self.exchanges = []
+        # (line number, name, expression)
+        self.rendering = []
+
+
+def read_sessions(path):
+    # Blank lines separate blocks. A block of '> input' lines, each followed
+    # by its expected output, starts a session (kiss.txt); a block of
+    # 'name = expression' lines renders the session before it (options.txt).
+    session = None
+    in_rendering = False
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            if not line.strip():
+                in_rendering = session is not None and bool(session.exchanges)
+                continue
+            if line.startswith('>'):
+                if session is not None and in_rendering:
+                    yield session
+                    session = None
+                if session is None:
+                    session = Session(path, number)
+                in_rendering = False
+                session.exchanges.append((number, line[1:].strip(), []))
+            elif in_rendering:
+                match = ASSIGNMENT.match(line.strip())
+                if match is not None:
+                    session.rendering.append((number, match.group(1), match.group(2)))
+            elif session is not None and session.exchanges:
+                session.exchanges[-1][2].append(line)
+    if session is not None:
+        yield session
+
+
+def operand(text, name2value):
+    match = DECIMAL.match(text)
+    if match is not None:
+        text = match.group(1).strip('\'"')
+    if text in name2value:
+        return name2value[text]
+    return decimal.Decimal(text)
+
+
+def evaluate_rendering(rendering):
+    # Only the assignments the renderer emits are understood, so the file is
+    # never handed to eval().
+    name2value = {}
+    for number, name, expression in rendering:
+        match = OPERATION.match(expression)
+        try:
+            if match is None:
+                value = operand(expression, name2value)
+            else:
+                left = operand(match.group(1), name2value)
+                right = operand(match.group(3), name2value)
+                if '*' == match.group(2):
+                    value = left * right
+                elif '/' == match.group(2):
+                    value = left / right
+                else:
+                    value = left - right
+        except (decimal.InvalidOperation, ArithmeticError):
+            raise ValueError('line %d: cannot evaluate %r' % (number, expression))
+        name2value[name] = value
+    return name2value
+
+
+def bucket(seconds):
+    if seconds <= 0:
+        return 0
+    return max(0, int(math.log(seconds * 1e9, 2) * BUCKETS_PER_OCTAVE))
+
+
+def bucket2seconds(index):
+    return 2 ** (float(index + 1) / BUCKETS_PER_OCTAVE) / 1e9
+
+
+class Report(object):
+    def __init__(self):
+        self.sessions = 0
+        self.lines = 0
+        self.mismatches = 0
+        self.seconds = 0.0
+        self.histogram = collections.defaultdict(int)
+        self.diffs = []
+
+    def add(self, other):
+        self.sessions += other.sessions
+        self.lines += other.lines
+        self.mismatches += other.mismatches
+        self.seconds += other.seconds
+        for index, count in other.histogram.items():
+            self.histogram[index] += count
+        self.diffs.extend(other.diffs[:MAX_DIFFS - len(self.diffs)])
+
+    def mismatch(self, diff):
+        self.mismatches += 1
+        if len(self.diffs) < MAX_DIFFS:
+            self.diffs.append(diff)
+
+    def percentile(self, fraction):
+        total = sum(self.histogram.values())
+        seen = 0
+        for index in sorted(self.histogram):
+            seen += self.histogram[index]
+            if seen >= fraction * total:
+                return bucket2seconds(index)
+        return 0.0
+
+
+def replay_session(new_program, session, report, setup):
+    program = new_program()
+    for message in setup:
+        program.message(message)
+    for number, message, expected in session.exchanges:
+        start = clock()
+        response = program.message(message)
+        elapsed = clock() - start
+        report.seconds += elapsed
+        report.histogram[bucket(elapsed)] += 1
+        report.lines += 1
+        if response.split('\n') != expected:
+            report.mismatch('%s:%d: > %s\n%s\n%s' % (
+                session.path, number, message,
+                '\n'.join('-' + line for line in expected),
+                '\n'.join('+' + line for line in response.split('\n')),
+            ))
+    if session.rendering:
+        number = session.rendering[-1][0]
+        try:
+            name2value = evaluate_rendering(session.rendering)
+        except ValueError as e:
+            report.mismatch('%s:%s' % (session.path, e))
+            return
+        for name, value in sorted(name2value.items()):
+            values = program.sym2val.get(name)
+            actual = values[-1].number if values else None
+            if actual != value:
+                report.mismatch('%s:%d: %s\n-%s\n+%s' % (session.path, number, name, value, actual))
+    report.sessions += 1
+
+
+def replay_sessions(args):
+    new_program, sessions, setup = args
+    report = Report()
+    for session in sessions:
+        replay_session(new_program, session, report, setup)
+    return report
+
+
+def read_all(paths):
+    for path in paths:
+        for session in read_sessions(path):
+            yield session
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def replay(new_program, paths, processes=None, setup=()):
+    report = Report()
+    tasks = ((new_program, sessions, setup) for sessions in chunks(read_all(paths), SESSIONS_PER_TASK))
+    start = time.time()
+    if 1 == processes:
+        for task in tasks:
+            report.add(replay_sessions(task))
+    else:
+        pool = multiprocessing.Pool(processes)
+        window = IN_FLIGHT * (processes or multiprocessing.cpu_count())
+        try:
+            # Pool.imap would read every task up front; feeding it a window
+            # at a time keeps memory flat however large the archive is.
+            for tasks_window in chunks(tasks, window):
+                for result in pool.imap_unordered(replay_sessions, tasks_window):
+                    report.add(result)
+        finally:
+            pool.close()
+            pool.join()
+    return report, time.time() - start
+
+
+def main(new_program, argv):
+    processes = None
+    setup = []
+    paths = []
+    arguments = iter(argv)
+    for argument in arguments:
+        if '--processes' == argument:
+            processes = int(next(arguments))
+        elif '--numeric' == argument:
+            setup.append(':numeric ' + next(arguments))
+        elif not argument.startswith('--'):
+            paths.append(argument)
+    report, elapsed = replay(new_program, paths, processes=processes, setup=tuple(setup))
+    for diff in report.diffs:
+        sys.stdout.write(diff + '\n')
+    if report.mismatches > len(report.diffs):
+        sys.stdout.write('... %d more mismatches\n' % (report.mismatches - len(report.diffs)))
+    sys.stdout.write('sessions=%d lines=%d mismatches=%d lines/s=%.0f evaluate lines/s=%.0f %s\n' % (
+        report.sessions,
+        report.lines,
+        report.mismatches,
+        report.lines / elapsed if elapsed else 0.0,
+        report.lines / report.seconds if report.seconds else 0.0,
+        ' '.join('p%s=%.1fus' % (('%g' % (100 * fraction)), 1e6 * report.percentile(fraction)) for fraction in PERCENTILES),
+    ))
+    return 1 if report.mismatches else 0
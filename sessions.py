@@ -0,0 +1,501 @@
+import binascii
+import collections
+import contextlib
+import decimal
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+
+
+MAX_SESSIONS = 100000
+MAX_BYTES = 256 * 2 ** 20
+TTL = 30 * 24 * 60 * 60
+MAX_HISTORY = 16
+COMPACT_EVERY = 100000
+LOCK_STRIPES = 64
+# Settings share the history rows with symbols. Words never contain
+# whitespace, so this prefix cannot collide with anything a user binds.
+SETTING = ' '
+
+SESSION_BYTES = sys.getsizeof(collections.defaultdict(list)) + sys.getsizeof('+15555555555')
+SYMBOL_BYTES = sys.getsizeof([]) + 3 * 8 + sys.getsizeof('')
+VALUE_BYTES = sys.getsizeof(object()) + sys.getsizeof(decimal.Decimal('1.5')) + 8
+
+
+class History(list):
+    # A plain list trimmed from the front: [-1] stays a C-level lookup and a
+    # short history costs a few pointers rather than a 64-slot deque block.
+    __slots__ = ('env', 'symbol', 'maxlen')
+
+    def __init__(self, env, symbol, maxlen):
+        list.__init__(self)
+        self.env = env
+        self.symbol = symbol
+        self.maxlen = maxlen
+
+    def restore(self, value):
+        list.append(self, value)
+        if len(self) > self.maxlen:
+            del self[0]
+        else:
+            self.env.size += VALUE_BYTES
+
+    def append(self, value):
+        self.restore(value)
+        if self.env.deltas is not None:
+            self.env.deltas.append((self.symbol, value))
+
+
+class Env(dict):
+    def __init__(self, max_history, record=True):
+        dict.__init__(self)
+        self.max_history = max_history
+        self.deltas = [] if record else None
+        self.settings = {}
+        # Built by reactive.py once a session turns reactive mode on; only
+        # ever held in memory.
+        self.graph = None
+        # Estimated bytes, kept up to date as symbols and values arrive so
+        # the store never has to walk a session to size it.
+        self.size = SESSION_BYTES
+
+    def __missing__(self, symbol):
+        values = History(self, symbol, self.max_history)
+        self[symbol] = values
+        self.size += SYMBOL_BYTES + len(symbol)
+        return values
+
+    def set(self, name, text):
+        self.settings[name] = text
+        if self.deltas is not None:
+            self.deltas.append((SETTING + name, text))
+
+    def dump(self, value2text):
+        rows = [(SETTING + name, text) for name, text in self.settings.items()]
+        for symbol, values in self.items():
+            rows.extend((symbol, value2text(value)) for value in values)
+        return rows
+
+    def load(self, rows, text2value):
+        for symbol, text in rows:
+            if symbol.startswith(SETTING):
+                self.settings[symbol[len(SETTING):]] = text
+            else:
+                self[symbol].restore(text2value(text))
+
+
+def writer_id():
+    return '%d.%s' % (os.getpid(), binascii.hexlify(os.urandom(4)).decode('ascii'))
+
+
+class MemoryBackend(object):
+    persistent = False
+
+    def load(self, phone, cursor):
+        return [], cursor, False
+
+    def append(self, phone, rows):
+        pass
+
+    def close(self):
+        pass
+
+
+class SqliteBackend(object):
+    persistent = True
+    CREATE = (
+        'CREATE TABLE IF NOT EXISTS history ('
+        'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+        'phone TEXT NOT NULL, '
+        'writer TEXT NOT NULL, '
+        'symbol TEXT NOT NULL, '
+        'value TEXT NOT NULL)'
+    )
+    INDEX = 'CREATE INDEX IF NOT EXISTS history_phone ON history (phone, symbol, seq)'
+    LOAD = 'SELECT seq, writer, symbol, value FROM history WHERE phone = ? AND seq > ? ORDER BY seq'
+    INSERT = 'INSERT INTO history (phone, writer, symbol, value) VALUES (?, ?, ?, ?)'
+    COMPACT = (
+        'DELETE FROM history WHERE ? <= ('
+        'SELECT COUNT(*) FROM history AS newer '
+        'WHERE newer.phone = history.phone AND newer.symbol = history.symbol AND newer.seq > history.seq)'
+    )
+
+    def __init__(self, path, max_history=MAX_HISTORY, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.max_history = max_history
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connection = None
+
+    def connect(self):
+        # Connections do not survive a pre-fork server's fork, so each
+        # worker process opens its own.
+        if self.pid != os.getpid():
+            # Imported here so processes that keep sessions in memory never
+            # pay for sqlite3 at startup.
+            import sqlite3
+            self.pid = os.getpid()
+            self.writer = writer_id()
+            self.appended = 0
+            self.connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute(self.CREATE)
+            self.connection.execute(self.INDEX)
+        return self.connection
+
+    def load(self, phone, cursor):
+        with self.lock:
+            rows = self.connect().execute(self.LOAD, (phone, cursor or 0)).fetchall()
+        if not rows:
+            # A phone with no rows yet is still loaded: with None left as
+            # the cursor, the next load would replay this writer's own rows.
+            return [], cursor or 0, False
+        loaded = [
+            (symbol, value)
+            for seq, writer, symbol, value in rows
+            if cursor is None or writer != self.writer
+        ]
+        return loaded, rows[-1][0], False
+
+    def append(self, phone, rows):
+        with self.lock:
+            connection = self.connect()
+            connection.execute('BEGIN')
+            try:
+                connection.executemany(self.INSERT, [(phone, self.writer, symbol, value) for symbol, value in rows])
+            except Exception:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            self.appended += len(rows)
+            if self.appended >= self.compact_every:
+                self.appended = 0
+                connection.execute(self.COMPACT, (self.max_history,))
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
+            self.pid = None
+
+
+class LogBackend(object):
+    persistent = True
+
+    def __init__(self, path, max_history=MAX_HISTORY, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.max_history = max_history
+        self.compact_every = compact_every
+        self.lock = threading.Lock()
+        self.pid = None
+        self.file = None
+        self.generation = 0
+
+    def open(self):
+        if self.file is not None:
+            self.file.close()
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.writer = writer_id()
+            self.appended = 0
+            self.lockfile = open(self.path + '.lock', 'a')
+        self.file = open(self.path, 'a+b')
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        # Cursors name the file they came from by this rather than by inode:
+        # a compacted file can be given the inode of one freed before it.
+        self.generation += 1
+        self.offset = 0
+        self.phone2offsets = collections.defaultdict(list)
+        self.scan()
+
+    def scan(self):
+        self.file.seek(self.offset)
+        while True:
+            line = self.file.readline()
+            if not line.endswith(b'\n'):
+                break
+            phone = json.loads(line.decode('utf-8'))[0]
+            self.phone2offsets[phone].append(self.offset)
+            self.offset += len(line)
+
+    def refresh(self):
+        if self.pid != os.getpid() or self.file is None:
+            self.open()
+        elif os.stat(self.path).st_ino != self.inode:
+            self.open()
+        else:
+            self.scan()
+
+    def load(self, phone, cursor):
+        with self.lock:
+            self.refresh()
+            # A compaction (ours or another writer's) rewrote the log since
+            # the cursor was taken, so offsets no longer say what the session
+            # has seen; it is rebuilt from the compacted rows instead.
+            reset = cursor is not None and cursor[0] != self.generation
+            start = 0 if cursor is None or reset else cursor[1]
+            rows = []
+            for offset in self.phone2offsets.get(phone, ()):
+                if offset < start:
+                    continue
+                self.file.seek(offset)
+                _, writer, symbol, value = json.loads(self.file.readline().decode('utf-8'))
+                if cursor is None or reset or writer != self.writer:
+                    rows.append((symbol, value))
+            return rows, (self.generation, self.offset), reset
+
+    def append(self, phone, rows):
+        with self.lock:
+            self.refresh()
+            data = b''.join(
+                json.dumps([phone, self.writer, symbol, value]).encode('utf-8') + b'\n'
+                for symbol, value in rows
+            )
+            fcntl.flock(self.lockfile, fcntl.LOCK_SH)
+            try:
+                if os.stat(self.path).st_ino != self.inode:
+                    self.open()
+                os.write(self.file.fileno(), data)
+            finally:
+                fcntl.flock(self.lockfile, fcntl.LOCK_UN)
+            self.appended += len(rows)
+            if self.appended >= self.compact_every:
+                self.appended = 0
+                self.compact()
+
+    def compact(self):
+        fcntl.flock(self.lockfile, fcntl.LOCK_EX)
+        try:
+            with open(self.path, 'rb') as f:
+                lines = f.readlines()
+            kept = []
+            counts = collections.defaultdict(int)
+            for line in reversed(lines):
+                if not line.endswith(b'\n'):
+                    continue
+                phone, _, symbol, _ = json.loads(line.decode('utf-8'))
+                counts[phone, symbol] += 1
+                if counts[phone, symbol] <= self.max_history:
+                    kept.append(line)
+            kept.reverse()
+            compacted = self.path + '.compact'
+            with open(compacted, 'wb') as f:
+                f.writelines(kept)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(compacted, self.path)
+            self.open()
+        finally:
+            fcntl.flock(self.lockfile, fcntl.LOCK_UN)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+            self.file = None
+
+
+def open_backend(url, max_history=MAX_HISTORY):
+    if not url or url == 'memory:':
+        return MemoryBackend()
+    scheme, _, path = url.partition(':')
+    if scheme == 'sqlite':
+        return SqliteBackend(path, max_history=max_history)
+    elif scheme == 'log':
+        return LogBackend(path, max_history=max_history)
+    else:
+        raise ValueError('Unknown session backend %r' % url)
+
+
+class Session(object):
+    __slots__ = ('sym2val', 'size', 'expires', 'cursor')
+
+    def __init__(self, sym2val, size, expires, cursor=None):
+        self.sym2val = sym2val
+        self.size = size
+        self.expires = expires
+        self.cursor = cursor
+
+
+class SessionStore(object):
+    def __init__(self, max_sessions=MAX_SESSIONS, max_bytes=MAX_BYTES, ttl=TTL, max_history=MAX_HISTORY, clock=time.time, backend=None, text2value=None, value2text=None, stripes=LOCK_STRIPES, snapshot=None, number2value=None):
+        self.lock = threading.Lock()
+        self.stripes = [threading.Lock() for _ in range(stripes)]
+        self.backend = MemoryBackend() if backend is None else backend
+        self.text2value = text2value
+        self.value2text = (lambda value: str(value.number)) if value2text is None else value2text
+        # A snapshot.Snapshot that sessions are paged in from the first time
+        # their phone is seen; a persistent backend replays its own history.
+        self.snapshot = None if self.backend.persistent else snapshot
+        self.number2value = (lambda number: self.text2value(str(number))) if number2value is None else number2value
+        self.paged = set()
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_history = max_history
+        self.clock = clock
+        self.phone2session = collections.OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def new_sym2val(self):
+        return Env(self.max_history, record=self.backend.persistent)
+
+    def stripe(self, phone):
+        return self.stripes[hash(phone) % len(self.stripes)]
+
+    @contextlib.contextmanager
+    def session(self, phone):
+        # Messages from one phone run one at a time; other phones hash to
+        # other stripes and proceed in parallel.
+        with self.stripe(phone):
+            sym2val = self.get(phone)
+            try:
+                yield sym2val
+            finally:
+                self.put(phone, sym2val)
+
+    def get(self, phone):
+        now = self.clock()
+        with self.lock:
+            session = self.phone2session.pop(phone, None)
+            if session is not None and session.expires <= now:
+                self.bytes -= session.size
+                self.expirations += 1
+                session = None
+            fresh = session is None
+            if fresh:
+                self.misses += 1
+                sym2val = self.new_sym2val()
+                session = Session(sym2val, sym2val.size, now + self.ttl)
+                self.bytes += session.size
+            else:
+                self.hits += 1
+                session.expires = now + self.ttl
+            self.phone2session[phone] = session
+            self.evict(now)
+        if fresh and self.snapshot is not None and phone not in self.paged:
+            # Only once: a session evicted since has moved on from its snapshot.
+            if self.snapshot.load(phone, session.sym2val, self.number2value):
+                self.paged.add(phone)
+        rows, session.cursor, reset = self.backend.load(phone, session.cursor)
+        if reset:
+            session.sym2val = self.new_sym2val()
+        if rows:
+            session.sym2val.load(rows, self.text2value)
+        return session.sym2val
+
+    def put(self, phone, sym2val):
+        now = self.clock()
+        if sym2val.deltas:
+            self.backend.append(phone, [
+                (symbol, value if symbol.startswith(SETTING) else self.value2text(value))
+                for symbol, value in sym2val.deltas
+            ])
+            del sym2val.deltas[:]
+        size = sym2val.size
+        with self.lock:
+            session = self.phone2session.pop(phone, None)
+            if session is None:
+                # Evicted while the message ran; the backend has its history.
+                return
+            self.bytes += size - session.size
+            session.sym2val = sym2val
+            session.size = size
+            session.expires = now + self.ttl
+            self.phone2session[phone] = session
+            self.evict(now)
+
+    def export(self, phone):
+        # Hands a session to another process: it leaves this store, and
+        # unless a shared backend already holds it, comes back as rows.
+        with self.stripe(phone):
+            with self.lock:
+                session = self.phone2session.pop(phone, None)
+                if session is None:
+                    return None
+                self.bytes -= session.size
+            if self.backend.persistent:
+                return None
+            return session.sym2val.dump(self.value2text)
+
+    def restore(self, phone, rows):
+        sym2val = self.new_sym2val()
+        sym2val.load(rows, self.text2value)
+        if self.snapshot is not None and phone in self.snapshot:
+            self.paged.add(phone)
+        now = self.clock()
+        with self.stripe(phone):
+            with self.lock:
+                old = self.phone2session.pop(phone, None)
+                if old is not None:
+                    self.bytes -= old.size
+                session = self.phone2session[phone] = Session(sym2val, sym2val.size, now + self.ttl)
+                self.bytes += session.size
+                self.evict(now)
+
+    def save(self, path):
+        # Writes every live session, and every snapshotted one not yet paged
+        # in, to a new snapshot at path.
+        import snapshot
+        now = self.clock()
+        with self.lock:
+            phone2sym2val = dict(
+                (phone, session.sym2val)
+                for phone, session in self.phone2session.items()
+                if session.expires > now
+            )
+        if self.snapshot is not None:
+            for phone in self.snapshot:
+                if phone not in phone2sym2val and phone not in self.paged:
+                    sym2val = self.new_sym2val()
+                    self.snapshot.load(phone, sym2val, self.number2value)
+                    phone2sym2val[phone] = sym2val
+        return snapshot.write(path, phone2sym2val.items())
+
+    def phones(self):
+        with self.lock:
+            return list(self.phone2session)
+
+    def evict(self, now):
+        while self.phone2session:
+            phone = next(iter(self.phone2session))
+            session = self.phone2session[phone]
+            if session.expires <= now:
+                self.expirations += 1
+            elif len(self.phone2session) > self.max_sessions or self.bytes > self.max_bytes:
+                self.evictions += 1
+            else:
+                break
+            del self.phone2session[phone]
+            self.bytes -= session.size
+
+    def close(self):
+        self.backend.close()
+
+    def __contains__(self, phone):
+        with self.lock:
+            session = self.phone2session.get(phone)
+        return session is not None and session.expires > self.clock()
+
+    def __len__(self):
+        return len(self.phone2session)
+
+    def stats(self):
+        return {
+            'sessions': len(self.phone2session),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
@@ -0,0 +1,520 @@
+import asyncio
+import bisect
+import hashlib
+import http
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import struct
+import sys
+import tempfile
+
+import asgi
+import idempotency
+import simple
+
+REPLICAS = 64
+WORKERS = 4
+HANDOFF_CHUNK = 1000
+QUIESCE_SECONDS = 10
+MAX_HEAD = 2 ** 14
+FRAME = struct.Struct('>I')
+POINT = struct.Struct('>Q')
+
+
+def point(key):
+    return POINT.unpack_from(hashlib.md5(key.encode('utf-8')).digest())[0]
+
+
+class Ring(object):
+    # Consistent hashing: adding or removing a worker only moves the phones
+    # on its own arcs, about 1/N of them, instead of reshuffling them all.
+    def __init__(self, names, replicas=REPLICAS):
+        self.names = sorted(names)
+        points = sorted((point('%s#%d' % (name, i)), name) for name in self.names for i in range(replicas))
+        self.points = [p for p, _ in points]
+        self.owners = [name for _, name in points]
+
+    def owner(self, phone):
+        return self.owners[bisect.bisect(self.points, point(phone)) % len(self.points)]
+
+
+def frame(message):
+    data = json.dumps(message).encode('utf-8')
+    return FRAME.pack(len(data)) + data
+
+
+async def read_frame(reader):
+    size, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return json.loads((await reader.readexactly(size)).decode('utf-8'))
+
+
+class Peer(object):
+    # One multiplexed unix socket connection to another worker; calls are
+    # matched to replies by id so many can be in flight at once.
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.connecting = None
+        self.id2future = {}
+        self.next = 0
+
+    async def connect(self):
+        if self.connecting is None:
+            self.connecting = asyncio.ensure_future(asyncio.open_unix_connection(self.path))
+        try:
+            reader, writer = await self.connecting
+        finally:
+            self.connecting = None
+        if self.writer is None:
+            self.writer = writer
+            asyncio.ensure_future(self.receive(reader, writer))
+        elif self.writer is not writer:
+            writer.close()
+
+    async def receive(self, reader, writer):
+        try:
+            while True:
+                id, result, error = await read_frame(reader)
+                future = self.id2future.pop(id, None)
+                if future is None or future.done():
+                    continue
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(RuntimeError(error))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if self.writer is writer:
+                self.writer = None
+            writer.close()
+            for future in self.id2future.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('lost connection to %s' % self.path))
+            self.id2future.clear()
+
+    async def call(self, *message):
+        if self.writer is None:
+            await self.connect()
+        self.next += 1
+        future = self.id2future[self.next] = asyncio.get_running_loop().create_future()
+        self.writer.write(frame([self.next] + list(message)))
+        return await future
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def peer_path(directory, name):
+    return os.path.join(directory, name + '.sock')
+
+
+class Worker(object):
+    def __init__(self, name, directory, names, version):
+        self.name = name
+        self.directory = directory
+        self.ring = Ring(names)
+        self.version = version
+        self.changed = asyncio.Event()
+        self.previous = None
+        self.name2peer = {}
+        self.phone2pull = {}
+        self.phone2handoff = {}
+        self.http = None
+        self.idle = set()
+        self.connections = 0
+        self.draining = False
+        self.store = simple.phone2env
+        # A retry can reach a different worker than the first delivery did,
+        # so the owner keeps its own replies by MessageSid as well.
+        self.replies = idempotency.ReplyCache()
+        # This process's webhook traffic, routed through the ring.
+        self.app = asgi.make_app(self.evaluate)
+
+    def peer(self, name):
+        peer = self.name2peer.get(name)
+        if peer is None:
+            peer = self.name2peer[name] = Peer(peer_path(self.directory, name))
+        return peer
+
+    async def catch_up(self, version):
+        # Calls carry the caller's ring version. Answering one from an older
+        # ring could recreate a session that has already moved away.
+        while self.version < version:
+            await self.changed.wait()
+
+    async def evaluate(self, phone, message, sid='', version=0):
+        await self.catch_up(version)
+        owner = self.ring.owner(phone)
+        if owner != self.name:
+            return await self.peer(owner).call('eval', phone, message, sid, self.version)
+        return await asgi.cached(self.replies, sid, lambda: self.reply(phone, message))
+
+    async def reply(self, phone, message):
+        if self.previous is not None:
+            await self.adopt(phone)
+        if self.store.backend.persistent:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, simple.reply, phone, message)
+        return simple.reply(phone, message)
+
+    async def adopt(self, phone):
+        # During a rebalance a phone's new owner may see its next message
+        # before the old owner has pushed the session over, so pull it.
+        old = self.previous.owner(phone)
+        if old == self.name or phone in self.store:
+            return
+        pull = self.phone2pull.get(phone)
+        if pull is None:
+            pull = self.phone2pull[phone] = asyncio.ensure_future(self.pull(old, phone))
+            pull.add_done_callback(lambda _: self.phone2pull.pop(phone, None))
+        await pull
+
+    async def pull(self, old, phone):
+        try:
+            rows = await self.peer(old).call('take', phone, self.version)
+        except OSError:
+            return
+        if rows and phone not in self.store:
+            self.store.restore(phone, rows)
+
+    async def on_eval(self, phone, message, sid, version):
+        return await self.evaluate(phone, message, sid, version)
+
+    async def on_take(self, phone, version):
+        await self.catch_up(version)
+        handoff = self.phone2handoff.get(phone)
+        if handoff is not None:
+            # Already on its way; once acknowledged the puller finds it local.
+            await handoff
+            return None
+        return self.store.export(phone)
+
+    async def on_give(self, pairs):
+        for phone, rows in pairs:
+            if phone not in self.store:
+                self.store.restore(phone, rows)
+        return len(pairs)
+
+    async def on_ring(self, names, version):
+        self.previous = self.ring
+        self.ring = Ring(names)
+        self.version = version
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    async def on_handoff(self):
+        owner2phones = {}
+        for phone in self.store.phones():
+            owner = self.ring.owner(phone)
+            if owner != self.name:
+                owner2phones.setdefault(owner, []).append(phone)
+        moved = await asyncio.gather(*[
+            self.push(owner, phones[i:i + HANDOFF_CHUNK])
+            for owner, phones in owner2phones.items()
+            for i in range(0, len(phones), HANDOFF_CHUNK)
+        ])
+        return sum(moved)
+
+    async def push(self, owner, phones):
+        done = asyncio.get_running_loop().create_future()
+        pairs = []
+        for phone in phones:
+            rows = self.store.export(phone)
+            if rows is not None:
+                pairs.append((phone, rows))
+                self.phone2handoff[phone] = done
+        try:
+            if pairs:
+                await self.peer(owner).call('give', pairs)
+        finally:
+            for phone, _ in pairs:
+                del self.phone2handoff[phone]
+            done.set_result(None)
+        return len(pairs)
+
+    async def on_settle(self):
+        self.previous = None
+
+    async def on_drain(self):
+        # Stop accepting, hang up on idle keep-alive connections and close
+        # busy ones after their current response.
+        self.draining = True
+        if self.http is not None:
+            self.http.close()
+            self.http = None
+        for writer in list(self.idle):
+            writer.close()
+
+    async def on_quiesce(self):
+        # Lets replies still in flight on a drained worker reach their
+        # clients before the launcher stops it.
+        while self.connections:
+            await asyncio.sleep(0.01)
+
+    async def on_stats(self):
+        stats = self.store.stats()
+        stats['idempotency'] = self.replies.stats()
+        return stats
+
+    async def answer(self, writer, id, command, args):
+        try:
+            result, error = await getattr(self, 'on_' + command)(*args), None
+        except Exception as e:
+            result, error = None, '%s: %s' % (type(e).__name__, e)
+        if not writer.is_closing():
+            writer.write(frame([id, result, error]))
+
+    async def serve_peer(self, reader, writer):
+        try:
+            while True:
+                message = await read_frame(reader)
+                asyncio.ensure_future(self.answer(writer, message[0], message[1], message[2:]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def serve_http(self, reader, writer):
+        # Just enough HTTP/1.1 (keep-alive, Content-Length bodies) to put the
+        # ASGI app behind a socket every worker accepts on.
+        self.connections += 1
+        try:
+            while not self.draining:
+                self.idle.add(writer)
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                finally:
+                    self.idle.discard(writer)
+                if writer.is_closing():
+                    # Drained while this request was arriving; the client
+                    # sees a reset and retries it elsewhere, unevaluated.
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                method, target, version = lines[0].split(' ', 2)
+                close = 'HTTP/1.0' == version or self.draining
+                headers = []
+                length = 0
+                chunked = False
+                for line in lines[1:]:
+                    if not line:
+                        continue
+                    name, _, value = line.partition(':')
+                    name = name.strip().lower()
+                    value = value.strip()
+                    headers.append((name.encode('latin-1'), value.encode('latin-1')))
+                    if 'content-length' == name:
+                        length = int(value)
+                    elif 'transfer-encoding' == name:
+                        chunked = True
+                    elif 'connection' == name:
+                        close = close or 'close' == value.lower()
+                if chunked:
+                    await respond_http(writer, 411, asgi.TEXT_PLAIN, b'Length Required', True)
+                    break
+                if length > asgi.MAX_BODY:
+                    await respond_http(writer, 413, asgi.TEXT_PLAIN, b'Request Entity Too Large', True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                path, _, query = target.partition('?')
+                scope = {
+                    'type': 'http',
+                    'method': method,
+                    'path': path,
+                    'query_string': query.encode('latin-1'),
+                    'headers': headers,
+                    'http_version': version[len('HTTP/'):],
+                }
+                response = {}
+
+                async def receive():
+                    return {'type': 'http.request', 'body': body, 'more_body': False}
+
+                async def send(event):
+                    if 'http.response.start' == event['type']:
+                        response['status'] = event['status']
+                        response['headers'] = event.get('headers', [])
+                    else:
+                        response['body'] = response.get('body', b'') + event.get('body', b'')
+
+                try:
+                    await self.app(scope, receive, send)
+                except Exception:
+                    response = {'status': 500, 'headers': asgi.TEXT_PLAIN, 'body': b'Internal Server Error'}
+                await respond_http(writer, response['status'], response['headers'], response.get('body', b''), close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def run(self, sock):
+        path = peer_path(self.directory, self.name)
+        await asyncio.start_unix_server(self.serve_peer, path)
+        self.http = await asyncio.start_server(self.serve_http, sock=sock, limit=MAX_HEAD)
+        await asyncio.get_running_loop().create_future()
+
+
+async def respond_http(writer, status, headers, body, close):
+    head = ['HTTP/1.1 %d %s' % (status, http.HTTPStatus(status).phrase)]
+    head.extend('%s: %s' % (name.decode('latin-1'), value.decode('latin-1')) for name, value in headers)
+    head.append('Content-Length: %d' % len(body))
+    if close:
+        head.append('Connection: close')
+    writer.write('\r\n'.join(head).encode('latin-1') + b'\r\n\r\n' + body)
+    await writer.drain()
+
+
+def work(name, directory, names, version, sock):
+    # Workers forked after the launcher's loop installed its handlers would
+    # otherwise report their own signals through its wakeup socket.
+    signal.set_wakeup_fd(-1)
+    for signum in (signal.SIGTERM, signal.SIGTTIN, signal.SIGTTOU):
+        signal.signal(signum, signal.SIG_DFL)
+    # The launcher owns the terminal; it stops workers itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(Worker(name, directory, names, version).run(sock))
+
+
+class Launcher(object):
+    def __init__(self, sock, workers=WORKERS):
+        self.sock = sock
+        self.workers = workers
+        self.directory = tempfile.mkdtemp(prefix='nolang-shards-')
+        self.names = []
+        self.version = 0
+        self.name2process = {}
+        self.name2peer = {}
+        self.count = 0
+        self.lock = None
+        self.stopping = None
+
+    def peer(self, name):
+        peer = self.name2peer.get(name)
+        if peer is None:
+            peer = self.name2peer[name] = Peer(peer_path(self.directory, name))
+        return peer
+
+    async def spawn(self, name):
+        path = peer_path(self.directory, name)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.name2peer.pop(name, None)
+        process = multiprocessing.Process(target=work, args=(name, self.directory, self.names, self.version, self.sock))
+        process.daemon = True
+        process.start()
+        self.name2process[name] = process
+        while not os.path.exists(path):
+            if not process.is_alive():
+                raise RuntimeError('worker %s exited with %s' % (name, process.exitcode))
+            await asyncio.sleep(0.01)
+
+    def new_name(self):
+        self.count += 1
+        return 'w%d' % (self.count - 1)
+
+    async def rebalance(self, names, notify):
+        # Everyone learns the new ring before anyone hands sessions off, so
+        # a pushed session always lands on a worker that expects it.
+        self.version += 1
+        for name in notify:
+            await self.peer(name).call('ring', names, self.version)
+        moved = await asyncio.gather(*[self.peer(name).call('handoff') for name in notify])
+        for name in names:
+            await self.peer(name).call('settle')
+        self.names = names
+        sys.stderr.write('workers %s, moved %d sessions\n' % (' '.join(names), sum(moved)))
+
+    async def add(self):
+        async with self.lock:
+            # The newcomer starts on the current ring so that, once the new
+            # one arrives, it knows whom to pull early arrivals' sessions from.
+            name = self.new_name()
+            await self.spawn(name)
+            names = self.names + [name]
+            await self.rebalance(names, names)
+
+    async def remove(self):
+        async with self.lock:
+            if len(self.names) <= 1:
+                return
+            name = self.names[-1]
+            await self.peer(name).call('drain')
+            await self.rebalance(self.names[:-1], self.names)
+            try:
+                await asyncio.wait_for(self.peer(name).call('quiesce'), QUIESCE_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.peer(name).close()
+            process = self.name2process.pop(name)
+            process.terminate()
+            await asyncio.get_running_loop().run_in_executor(None, process.join)
+
+    async def supervise(self):
+        # A crashed worker is restarted under the same name, so the ring is
+        # unchanged; its in-memory sessions are gone unless a backend has them.
+        while True:
+            await asyncio.sleep(1)
+            async with self.lock:
+                for name in self.names:
+                    if not self.name2process[name].is_alive():
+                        sys.stderr.write('worker %s exited with %s, restarting\n' % (name, self.name2process[name].exitcode))
+                        await self.spawn(name)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.lock = asyncio.Lock()
+        self.stopping = loop.create_future()
+        self.names = [self.new_name() for _ in range(self.workers)]
+        for name in self.names:
+            await self.spawn(name)
+        loop.add_signal_handler(signal.SIGTTIN, lambda: asyncio.ensure_future(self.add()))
+        loop.add_signal_handler(signal.SIGTTOU, lambda: asyncio.ensure_future(self.remove()))
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, lambda: self.stopping.done() or self.stopping.set_result(None))
+        supervisor = asyncio.ensure_future(self.supervise())
+        try:
+            await self.stopping
+        finally:
+            supervisor.cancel()
+            for process in self.name2process.values():
+                process.terminate()
+            for process in self.name2process.values():
+                process.join()
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def listen(host, port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.setblocking(False)
+    return sock
+
+
+def main(argv):
+    workers = multiprocessing.cpu_count()
+    host = '0.0.0.0'
+    port = 5000
+    if '--workers' in argv:
+        workers = int(argv[argv.index('--workers') + 1])
+    if '--host' in argv:
+        host = argv[argv.index('--host') + 1]
+    if '--port' in argv:
+        port = int(argv[argv.index('--port') + 1])
+    sock = listen(host, port)
+    sys.stderr.write('listening on %s:%d with %d workers (SIGTTIN adds one, SIGTTOU removes one)\n' % (host, port, workers))
+    asyncio.run(Launcher(sock, workers).run())
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
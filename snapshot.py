@@ -0,0 +1,208 @@
+import binascii
+import decimal
+import mmap
+import os
+import struct
+
+MAGIC = b'NOLS'
+# magic, strings, phones
+HEADER = struct.Struct('<4sII')
+# phone string id
+PHONE = struct.Struct('<I')
+RECORD = struct.Struct('<Q')
+# settings, symbols
+COUNTS = struct.Struct('<II')
+SETTING = struct.Struct('<II')
+# symbol string id, values
+SYMBOL = struct.Struct('<IH')
+# flags, exponent, coefficient bytes
+VALUE = struct.Struct('<BiH')
+TEXT = struct.Struct('<I')
+
+# The low bit of a value's flags is its sign; the rest is its kind.
+FINITE, INFINITE, NAN, SNAN, STRING = range(5)
+KINDS = {'F': INFINITE, 'n': NAN, 'N': SNAN}
+MAX_EXPONENT = 2 ** 31 - 1
+MAX_BYTES = 2 ** 16 - 1
+# Exact for any coefficient and exponent a snapshot keeps.
+EXACT = decimal.Context(prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN)
+
+
+class Strings(object):
+    # Symbols, phones, setting names and texts, each stored once however
+    # many sessions use it.
+    def __init__(self):
+        self.string2id = {}
+        self.strings = []
+
+    def intern(self, string):
+        id = self.string2id.get(string)
+        if id is None:
+            id = self.string2id[string] = len(self.strings)
+            self.strings.append(string.encode('utf-8'))
+        return id
+
+
+def pack_number(number, strings):
+    # A Decimal as its sign, its coefficient as a binary integer and its
+    # exponent, so the exponent (and with it trailing zeros, '1.50')
+    # survives the trip.
+    if isinstance(number, float):
+        number = decimal.Decimal(repr(number))
+    sign, digits, exponent = number.as_tuple()
+    kind = KINDS.get(exponent)
+    if kind is not None:
+        coefficient = int(''.join(map(str, digits)) or '0')
+        exponent = 0
+    elif abs(exponent) > MAX_EXPONENT:
+        kind = STRING
+    else:
+        kind = FINITE
+        coefficient = abs(int(number.scaleb(-exponent, EXACT)))
+    if STRING != kind:
+        text = '%x' % coefficient
+        packed = binascii.unhexlify('0' * (len(text) % 2) + text)
+        if len(packed) <= MAX_BYTES:
+            return VALUE.pack(kind << 1 | sign, exponent, len(packed)) + packed
+    return VALUE.pack(STRING << 1, 0, 0) + TEXT.pack(strings.intern(str(number)))
+
+
+def pack_session(sym2val, strings):
+    parts = [COUNTS.pack(len(sym2val.settings), len(sym2val))]
+    for name, text in sorted(sym2val.settings.items()):
+        parts.append(SETTING.pack(strings.intern(name), strings.intern(text)))
+    for symbol, values in sym2val.items():
+        parts.append(SYMBOL.pack(strings.intern(symbol), len(values)))
+        parts.extend(pack_number(value.number, strings) for value in values)
+    return b''.join(parts)
+
+
+def write(path, sessions):
+    # sessions is (phone, sym2val) pairs, values with a .number Decimal.
+    # Phones are laid out in sorted order so a lookup is a binary search
+    # over the mapped index rather than a table read in at startup.
+    strings = Strings()
+    records = []
+    for phone, sym2val in sessions:
+        records.append((phone.encode('utf-8'), strings.intern(phone), pack_session(sym2val, strings)))
+    records.sort()
+    string_offsets = [0]
+    for string in strings.strings:
+        string_offsets.append(string_offsets[-1] + len(string))
+    record_offsets = [0]
+    for _, _, record in records:
+        record_offsets.append(record_offsets[-1] + len(record))
+    # Write then rename so a server starting up never maps a half-written
+    # snapshot, as words.build does.
+    temporary = '%s.%d' % (path, os.getpid())
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(strings.strings), len(records)))
+        f.write(struct.pack('<%dQ' % len(string_offsets), *string_offsets))
+        f.write(b''.join(strings.strings))
+        f.write(struct.pack('<%dI' % len(records), *[id for _, id, _ in records]))
+        f.write(struct.pack('<%dQ' % len(record_offsets), *record_offsets))
+        for _, _, record in records:
+            f.write(record)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(temporary, path)
+    return len(records)
+
+
+class Snapshot(object):
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.string_count, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a session snapshot' % path)
+        self.string_offsets = HEADER.size
+        self.string_base = self.string_offsets + 8 * (self.string_count + 1)
+        end, = RECORD.unpack_from(self.map, self.string_base - 8)
+        self.phones = self.string_base + end
+        self.record_offsets = self.phones + 4 * self.count
+        self.record_base = self.record_offsets + 8 * (self.count + 1)
+
+    def __len__(self):
+        return self.count
+
+    def raw(self, id):
+        start, end = struct.unpack_from('<QQ', self.map, self.string_offsets + 8 * id)
+        return self.map[self.string_base + start:self.string_base + end]
+
+    def string(self, id):
+        return self.raw(id).decode('utf-8')
+
+    def phone(self, index):
+        return self.raw(PHONE.unpack_from(self.map, self.phones + 4 * index)[0])
+
+    def find(self, phone):
+        key = phone.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.phone(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.phone(low) == key:
+            return low
+        return -1
+
+    def __contains__(self, phone):
+        return self.find(phone) >= 0
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield self.phone(index).decode('utf-8')
+
+    def number(self, offset):
+        flags, exponent, size = VALUE.unpack_from(self.map, offset)
+        offset += VALUE.size
+        kind = flags >> 1
+        if STRING == kind:
+            id, = TEXT.unpack_from(self.map, offset)
+            return decimal.Decimal(self.string(id)), offset + TEXT.size
+        coefficient = int(binascii.hexlify(self.map[offset:offset + size]) or b'0', 16)
+        if FINITE == kind:
+            # Not through text, which Python limits to 4300 digits for ints.
+            number = decimal.Decimal(coefficient).scaleb(exponent, EXACT)
+        elif INFINITE == kind:
+            number = decimal.Decimal('Infinity')
+        else:
+            number = decimal.Decimal('%s%s' % ('NaN' if NAN == kind else 'sNaN', coefficient or ''))
+        if flags & 1:
+            number = number.copy_negate()
+        return number, offset + size
+
+    def load(self, phone, sym2val, number2value):
+        # Pages one phone's session into sym2val without reading any other.
+        index = self.find(phone)
+        if index < 0:
+            return False
+        start, = RECORD.unpack_from(self.map, self.record_offsets + 8 * index)
+        offset = self.record_base + start
+        settings, symbols = COUNTS.unpack_from(self.map, offset)
+        offset += COUNTS.size
+        for _ in range(settings):
+            name, text = SETTING.unpack_from(self.map, offset)
+            offset += SETTING.size
+            sym2val.settings[self.string(name)] = self.string(text)
+        for _ in range(symbols):
+            symbol, count = SYMBOL.unpack_from(self.map, offset)
+            offset += SYMBOL.size
+            history = sym2val[self.string(symbol)]
+            for _ in range(count):
+                number, offset = self.number(offset)
+                history.restore(number2value(number))
+        return True
+
+    def close(self):
+        self.map.close()
+
+
+def open_snapshot(path):
+    if not path or not os.path.exists(path):
+        return None
+    return Snapshot(path)
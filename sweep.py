@@ -0,0 +1,167 @@
+import decimal
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import lexer
+import reactive
+import translate
+
+MAX_POINTS = 100000
+MAX_REPORTED = 5
+RANGE = re.compile(r'(\S+) is (\S+) to (\S+)(?: step (\S+))?\Z')
+LIST = re.compile(r'(\S+) is (\S+(?: ?, ?\S+)+)\Z')
+
+
+def number(word):
+    if not lexer.LITERAL.match(word):
+        raise ValueError("'%s' is not a number" % word)
+    return decimal.Decimal(word)
+
+
+def parse(message):
+    # 'strike is 250 to 350 step 1' or 'strike is 250, 275, 300'; None for
+    # anything else, which is then just an ordinary message.
+    text = ' '.join(message.lower().split())
+    match = RANGE.match(text)
+    if match is not None:
+        symbol, start, stop, step = match.groups()
+        start, stop = number(start), number(stop)
+        step = number(step) if step else decimal.Decimal(1)
+        if step <= 0:
+            raise ValueError('the step must be more than zero')
+        if (stop - start) / step >= MAX_POINTS:
+            raise ValueError('that is more than %d values' % MAX_POINTS)
+        candidates = []
+        value = start
+        while value <= stop:
+            candidates.append(value)
+            value = start + len(candidates) * step
+        return symbol, candidates
+    match = LIST.match(text)
+    if match is not None:
+        symbol, values = match.groups()
+        candidates = [number(value.strip()) for value in values.split(',') if value.strip()]
+        if len(candidates) > MAX_POINTS:
+            raise ValueError('that is more than %d values' % MAX_POINTS)
+        return symbol, candidates
+    return None
+
+
+def is_column(value):
+    return isinstance(value, list) or (numpy is not None and isinstance(value, numpy.ndarray))
+
+
+def apply_exact(function, operands, size):
+    # One map per node over the whole column, through the tier's own
+    # Decimal operations; a failing value (say a division by zero) only
+    # blanks its own point.
+    columns = [operand if is_column(operand) else [operand] * size for operand in operands]
+    try:
+        return list(map(function, *columns))
+    except (ArithmeticError, TypeError):
+        pass
+    results = []
+    for values in zip(*columns):
+        try:
+            results.append(None if None in values else function(*values))
+        except ArithmeticError:
+            results.append(None)
+    return results
+
+
+VECTORIZED = {
+    'times': lambda left, right: numpy.multiply(left, right),
+    'over': lambda left, right: numpy.divide(left, right),
+    'minus': lambda left, right: numpy.subtract(left, right),
+    # Half-even, as round() is for the float tier.
+    'integral': lambda value: numpy.round(value),
+}
+
+
+def sweep(sym2val, symbol, candidates, numbers):
+    # Evaluates every symbol downstream of symbol in reactive mode's graph
+    # once per node over the whole candidate column, without touching the
+    # session. Returns [(symbol, column)] in dependency order.
+    graph = sym2val.graph
+    if graph is None:
+        return []
+    vectorized = numpy is not None and 'float' == getattr(numbers, 'mode', None)
+    size = len(candidates)
+    if vectorized:
+        symbol2column = {symbol: numpy.array([float(value) for value in candidates])}
+    else:
+        symbol2column = {symbol: list(candidates)}
+    results = []
+    for dependent in graph.downstream(set([symbol])):
+        node2value = {}
+        stack = [graph.symbol2formula[dependent]]
+        while stack:
+            node = stack[-1]
+            if id(node) in node2value:
+                stack.pop()
+                continue
+            if isinstance(node, reactive.Reference):
+                value = symbol2column.get(node.symbol)
+                if value is None:
+                    value = sym2val[node.symbol][-1].number
+                    if vectorized:
+                        value = float(value)
+            elif isinstance(node, translate.Literal):
+                value = float(node.value) if vectorized else node.value
+            else:
+                pending = [operand for operand in node.operands if id(operand) not in node2value]
+                if pending:
+                    stack.extend(pending)
+                    continue
+                operands = [node2value[id(operand)] for operand in node.operands]
+                if vectorized:
+                    with numpy.errstate(all='ignore'):
+                        value = VECTORIZED[node.operation](*operands)
+                else:
+                    value = apply_exact(getattr(numbers, node.operation), operands, size)
+            node2value[id(node)] = value
+            stack.pop()
+        column = node2value[id(graph.symbol2formula[dependent])]
+        if not is_column(column):
+            continue
+        symbol2column[dependent] = column
+        results.append((dependent, column))
+    return results
+
+
+def finite(value):
+    return value is not None and value == value and abs(value) != float('inf')
+
+
+def summarize(symbol, candidates, results, numbers):
+    lines = ['%s, %d values from %s to %s:' % (symbol, len(candidates), min(candidates), max(candidates))]
+    for dependent, column in results[:MAX_REPORTED]:
+        points = [(value, i) for i, value in enumerate(column) if finite(value)]
+        if not points:
+            lines.append('%s has no value anywhere in the range' % dependent)
+            continue
+        low, high = min(points), max(points)
+        lines.append('%s from %s to %s, min %s (%s %s), max %s (%s %s)' % (
+            dependent,
+            numbers.text(column[0]) if finite(column[0]) else '?',
+            numbers.text(column[-1]) if finite(column[-1]) else '?',
+            numbers.text(low[0]), symbol, candidates[low[1]],
+            numbers.text(high[0]), symbol, candidates[high[1]],
+        ))
+    if len(results) > MAX_REPORTED:
+        lines.append('and %d more' % (len(results) - MAX_REPORTED))
+    return '\n'.join(lines)
+
+
+def message(sym2val, parsed, numbers):
+    symbol, candidates = parsed
+    if not candidates:
+        return 'Sorry, there are no values to try for %s' % symbol
+    results = sweep(sym2val, symbol, candidates, numbers)
+    if not results:
+        return 'Sorry, nothing I know is computed from %s' % symbol
+    return summarize(symbol, candidates, results, numbers)
@@ -0,0 +1,37 @@
+import pytest
+
+import admission
+import idempotency
+
+
+def gate(**options):
+    settings = dict(admission.OPTIONS)
+    settings.update(options)
+    return admission.Gate(**settings)
+
+
+def test_queue_full_does_not_spend_a_token():
+    g = gate(burst=1.0, rate=0.0, queue=0)
+    with pytest.raises(admission.Busy):
+        g.run('+1', lambda: 'ran')
+    g.queue = 1
+    assert g.run('+1', lambda: 'ran') == 'ran'
+    assert g.stats()['shed'] == {'rate': 0, 'queue': 1, 'deadline': 0}
+
+
+def test_shed_is_not_a_miss_or_failure():
+    cache = idempotency.ReplyCache()
+    g = gate(burst=1.0, rate=0.0)
+
+    def reply(sid):
+        try:
+            return cache.compute(sid, lambda: g.run('+1', lambda: sid), declined=admission.Busy)
+        except admission.Busy:
+            return admission.BUSY
+
+    assert reply('S1') == 'S1'
+    assert reply('S2') == admission.BUSY
+    assert reply('S1') == 'S1'
+    stats = cache.stats()
+    assert (stats['misses'], stats['hits'], stats['failures'], stats['declined']) == (1, 1, 0, 1)
+    assert stats['entries'] == 1
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+import batch
+import simple
+
+
+class Exits(object):
+    def __init__(self, sym2val=None):
+        pass
+
+    def message(self, message):
+        os._exit(1)
+
+
+def test_failing_message_gets_an_error_reply():
+    records = [('1', '5'), ('1', 'over 0'), ('1', 'times 2')]
+    results = list(batch.evaluate(records, simple.Program, processes=2))
+    assert results == [('1', '5', '5'), ('1', 'over 0', 'Error: DivisionByZero'), ('1', 'times 2', '10')]
+
+
+def test_dead_worker_is_an_error_not_a_hang(monkeypatch):
+    monkeypatch.setattr(batch, 'POLL', 0.05)
+    with pytest.raises(RuntimeError):
+        list(batch.evaluate([('1', '5')], Exits, processes=1))
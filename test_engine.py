@@ -0,0 +1,111 @@
+import pytest
+
+import engine
+import nois
+import nolang
+import simple
+
+# Replies the baseline's word-state classes gave, message by message.
+NOLANG_TRANSCRIPT = (
+    ('1671', '1671'),
+    ('is fair', 'What is is?'),
+    ('x is 1671', '1671'),
+    ('x', '1671'),
+    ('x times 2', '3342'),
+    ('x over 4', '417.75'),
+    ('x minus 1', '1670'),
+    ('0 over 0', "I don't know how to divide 0 by 0"),
+    ('inf minus inf', "I don't know how to subtract inf from Infinity"),
+    ('0 times inf', "I don't know how to multiply 0 and inf"),
+    ('inf', 'Infinity'),
+    ('2 times inf', 'Infinity'),
+    ('y', 'Symbol y'),
+    ('y is', 'y is . . .'),
+    ('y is z', "Sorry, I don't want to point 'y' to 'z' when I don't know what 'z' means"),
+    ('is', 'What is is?'),
+    ('5 is', "I don't know what to do with the number 5 and the word is"),
+    ('5 round', "I don't know what to do with the number 5 and the word round"),
+    ('q times 3', "Sorry, I don't (yet) know what to do with 'q' and 'times' together"),
+    ('3 times q', "I don't know how to multiply 3 and q"),
+    ('3 over q', "I don't know how to divide 3 by q"),
+    ('3 minus q', "I don't know how to subtract q from 3"),
+    ('', 'Empty expression'),
+    ('X', 'Symbol X'),
+    ('x is 2 times 3', "I don't know what to do with the number 1671 and the word is"),
+    ('x', '1671'),
+    ('1.50 times 2', '3.00'),
+    ('-3 minus -4', '1'),
+    ('nan times 2', 'NaN'),
+    ('1e3 over 8', '125'),
+)
+SIMPLE_TRANSCRIPT = (
+    ('1671', '1671'),
+    ('is fair', '1671'),
+    ('times 2', '3342'),
+    ('round', '3342'),
+    ('over 7', '477.4285714285714285714285714'),
+    ('minus 3', '474.4285714285714285714285714'),
+    ('x is 5', '5'),
+    ('x times x', '25'),
+    ('X TIMES 2', '10'),
+    ('0 over 0', "I don't know how to divide 0 by 0"),
+    ('inf minus inf', "I don't know how to subtract inf from Infinity"),
+    ('0 times inf', "I don't know how to multiply 0 and inf"),
+    ('1 over 3', '0.3333333333333333333333333333'),
+    ('round', '0'),
+    ('fair', '1671'),
+    ('5 is bob', '5'),
+    ('bob', '5'),
+    ('foo bar', "Sorry, I don't (yet) know what to do with 'foo' and 'bar' together"),
+    ('zzz times 3', "Sorry, I don't (yet) know what to do with 'zzz' and 'times' together"),
+    ('y is', 'y is . . .'),
+    ('y is q', "Sorry, I don't want to point 'y' to 'q' when I don't know what 'q' means"),
+    ('', ''),
+    ('1.50 times 2', '3.00'),
+    ('inf', 'Infinity'),
+    ('nan', 'NaN'),
+)
+NOIS_TRANSCRIPT = (
+    ('1671', '1671 (word)'),
+    ('times 2', '3342 (word)'),
+    ('round', '3342 (word)'),
+    ('0 over 0', "I don't know how to divide 0 by 0"),
+    ('inf minus inf', "I don't know how to subtract inf from Infinity"),
+    ('0 times inf', "I don't know how to multiply 0 and inf"),
+    ('x', 'Symbol x'),
+    ('x times 2', "Sorry, I don't (yet) know what to do with 'x' and 'times' together"),
+    ('is', 'Symbol is'),
+    ('5 is', "I don't know what to do with the number 5 and the word is"),
+    ('3 over q', "I don't know how to divide 3 by q"),
+    ('1.50 minus 2', '-0.50 (word)'),
+    ('', ''),
+    ('inf', 'Infinity (word)'),
+    ('over 3', 'Infinity (word)'),
+)
+
+
+@pytest.mark.parametrize('new_program, transcript', [
+    (nolang.Program, NOLANG_TRANSCRIPT),
+    (simple.Program, SIMPLE_TRANSCRIPT),
+    (lambda: nois.Program(allwords=['word']), NOIS_TRANSCRIPT),
+], ids=['nolang', 'simple', 'nois'])
+def test_transcript_matches_baseline(new_program, transcript):
+    program = new_program()
+    assert [program.message(message) for message, _ in transcript] == [response for _, response in transcript]
+
+
+def test_programs_run_their_dialect():
+    assert nolang.Program.dialect is engine.NOLANG
+    assert simple.Program.dialect is engine.SIMPLE
+    assert nois.Program.dialect is engine.NOIS
+
+
+@pytest.mark.parametrize('message, response', [
+    ('0 over 0', "I don't know how to divide 0 by 0"),
+    ('inf minus inf', "I don't know how to subtract inf from Infinity"),
+    ('0 times inf', "I don't know how to multiply 0 and inf"),
+])
+def test_undefined_literal_arithmetic_is_an_error(message, response):
+    program = simple.Program()
+    assert program.message(message) == response
+    assert 'that' not in program.sym2val
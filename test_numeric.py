@@ -0,0 +1,14 @@
+import pytest
+
+import simple
+
+
+@pytest.mark.parametrize('spec', ['cents', 'mode=fixed,precision=5'])
+def test_fixed_tier_keeps_results_too_long_for_its_places(spec):
+    program = simple.Program()
+    program.message(':numeric ' + spec)
+    assert program.message('1e30 times 1') == '1E+30'
+    assert program.message('x is 1e30') == '1E+30'
+    assert program.message('x times 1') == '1E+30'
+    assert program.message('inf times 2') == 'Infinity'
+    assert program.message('1 over 4') == '0.25'
@@ -0,0 +1,13 @@
+import io
+
+import pytest
+
+import repl
+import simple
+
+
+def test_replies_before_a_failing_message_are_written():
+    target = io.StringIO()
+    with pytest.raises(ArithmeticError):
+        repl.stream(simple.Program(), io.StringIO(u'5\ntimes 2\n1 over 0\n'), target)
+    assert target.getvalue() == '5\n10\n'
@@ -0,0 +1,134 @@
+import decimal
+import sqlite3
+
+import pytest
+
+import engine
+import sessions
+import simple
+
+
+def open_store(kind, path, max_history=sessions.MAX_HISTORY, compact_every=sessions.COMPACT_EVERY):
+    if 'sqlite' == kind:
+        backend = sessions.SqliteBackend(str(path), max_history=max_history, compact_every=compact_every)
+    else:
+        backend = sessions.LogBackend(str(path), max_history=max_history, compact_every=compact_every)
+    return sessions.SessionStore(
+        backend=backend,
+        max_history=max_history,
+        text2value=lambda text: engine.Number(decimal.Decimal(text)),
+    )
+
+
+def bind(store, phone, symbol, text):
+    with store.session(phone) as sym2val:
+        sym2val[symbol].append(engine.Number(decimal.Decimal(text)))
+
+
+def history(store, phone, symbol):
+    with store.session(phone) as sym2val:
+        return [str(value.number) for value in sym2val[symbol]]
+
+
+def row_count(kind, path):
+    if 'sqlite' == kind:
+        connection = sqlite3.connect(str(path))
+        try:
+            return connection.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+        finally:
+            connection.close()
+    with open(str(path), 'rb') as f:
+        return len(f.readlines())
+
+
+@pytest.fixture(params=['sqlite', 'log'])
+def kind(request):
+    return request.param
+
+
+def test_new_phone_does_not_replay_own_rows(kind, tmp_path):
+    store = open_store(kind, tmp_path / 'sessions')
+    bind(store, '+1', 'that', '5')
+    bind(store, '+1', 'that', '7')
+    assert history(store, '+1', 'that') == ['5', '7']
+    store.close()
+
+
+def test_simple_messages_on_a_new_phone(kind, tmp_path, monkeypatch):
+    monkeypatch.setattr(simple, 'phone2env', open_store(kind, tmp_path / 'sessions'))
+    simple.reply('+1', '5')
+    simple.reply('+1', 'x is 7')
+    assert history(simple.phone2env, '+1', 'that') == ['5', '7']
+    assert history(simple.phone2env, '+1', 'x') == ['7']
+    simple.phone2env.close()
+
+
+def test_cursor_picks_up_other_writers(kind, tmp_path):
+    path = tmp_path / 'sessions'
+    first = open_store(kind, path)
+    second = open_store(kind, path)
+    bind(first, '+1', 'x', '1')
+    assert history(second, '+1', 'x') == ['1']
+    bind(second, '+1', 'x', '2')
+    bind(first, '+1', 'x', '3')
+    assert history(first, '+1', 'x') == ['1', '2', '3']
+    assert history(second, '+1', 'x') == ['1', '2', '3']
+    first.close()
+    second.close()
+
+
+def test_restart_loads_history(kind, tmp_path):
+    path = tmp_path / 'sessions'
+    store = open_store(kind, path)
+    bind(store, '+1', 'x', '1')
+    bind(store, '+2', 'y', '2')
+    with store.session('+1') as sym2val:
+        sym2val.set('numeric', 'cents')
+    store.close()
+    store = open_store(kind, path)
+    assert history(store, '+1', 'x') == ['1']
+    assert history(store, '+2', 'y') == ['2']
+    with store.session('+1') as sym2val:
+        assert sym2val.settings == {'numeric': 'cents'}
+    store.close()
+
+
+def test_compaction_keeps_recent_history(kind, tmp_path):
+    path = tmp_path / 'sessions'
+    store = open_store(kind, path, max_history=2, compact_every=4)
+    for i in range(10):
+        bind(store, '+1', 'x', str(i))
+        bind(store, '+2', 'y', str(i))
+    assert history(store, '+1', 'x') == ['8', '9']
+    store.close()
+    # Two rows per symbol, plus whatever arrived since the last compaction.
+    assert row_count(kind, path) <= 2 * 2 + 4
+    store = open_store(kind, path, max_history=2)
+    assert history(store, '+1', 'x') == ['8', '9']
+    assert history(store, '+2', 'y') == ['8', '9']
+    store.close()
+
+
+def test_compaction_under_another_writer(kind, tmp_path):
+    path = tmp_path / 'sessions'
+    first = open_store(kind, path, max_history=2, compact_every=3)
+    second = open_store(kind, path, max_history=2, compact_every=3)
+    for i in range(6):
+        bind(first if i % 2 else second, '+1', 'x', str(i))
+    assert history(first, '+1', 'x') == ['4', '5']
+    assert history(second, '+1', 'x') == ['4', '5']
+    first.close()
+    second.close()
+
+
+def test_size_follows_symbols_and_values():
+    store = sessions.SessionStore(max_history=2)
+    with store.session('+1') as sym2val:
+        for i in range(5):
+            sym2val['v%d' % (i % 3)].append(engine.Number(decimal.Decimal(i)))
+    expected = sessions.SESSION_BYTES + sum(
+        sessions.SYMBOL_BYTES + len(symbol) + sessions.VALUE_BYTES * len(values)
+        for symbol, values in sym2val.items()
+    )
+    assert sym2val.size == expected
+    assert store.bytes == expected
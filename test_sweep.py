@@ -0,0 +1,24 @@
+import pytest
+
+import simple
+
+
+@pytest.mark.parametrize('message', ['strike is 250,275,300', 'strike is 250, 275, 300', 'strike is 250 to 300 step 25'])
+def test_sweep_runs_instead_of_binding(message):
+    program = simple.Program()
+    for setup in (':reactive on', 'strike is 300', 'fair is 1671', 'fair minus strike', 'is spread'):
+        program.message(setup)
+    response = program.message(message)
+    assert response.splitlines() == [
+        'strike, 3 values from 250 to 300:',
+        'spread from 1421 to 1371, min 1371 (strike 300), max 1421 (strike 250)',
+    ]
+    assert '250,275,300' not in program.sym2val
+    assert [str(value.number) for value in program.sym2val['strike']] == ['300']
+
+
+def test_sweep_needs_reactive_mode():
+    program = simple.Program()
+    program.message('strike is 300')
+    assert program.message('strike is 250,275,300').startswith('Sorry, I can only try values for strike')
+    assert '250,275,300' not in program.sym2val
@@ -0,0 +1,20 @@
+import decimal
+
+import pytest
+
+import translate
+
+SESSION = ('1671', 'is fair', '303', 'is strike', '108 times strike', 'over fair', 'round')
+
+
+def test_translation_agrees_with_the_interpreter(tmp_path):
+    session = translate.load(SESSION, cache=str(tmp_path))
+    assert str(session({})['that']) == '20'
+    assert str(session({'fair': decimal.Decimal(1000)})['that']) == '33'
+
+
+def test_reactive_session_is_refused(tmp_path):
+    with pytest.raises(ValueError) as e:
+        translate.load(('x is 2', ':reactive on', 'y is x times 3', 'x is 5'), cache=str(tmp_path))
+    assert 'reactive' in str(e.value)
+    assert not list(tmp_path.iterdir())
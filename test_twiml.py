@@ -0,0 +1,27 @@
+import io
+
+import twiml
+
+EXPECTED = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n<Response>\n'
+    b'    <Message>\n        <Body>1 &lt; 2 &amp; 3</Body>\n    </Message>\n'
+    b'    <Message>\n        <Body>caf\xc3\xa9</Body>\n    </Message>\n'
+    b'</Response>'
+)
+
+
+def test_one_response():
+    assert twiml.response2bytes('1 < 2') == twiml.responses2bytes(['1 < 2'])
+
+
+def test_several_responses_in_one_document():
+    assert twiml.responses2bytes(['1 < 2 & 3', u'caf\xe9']) == EXPECTED
+
+
+def test_write_to_a_buffer_or_a_file():
+    buffer = bytearray()
+    twiml.write(buffer, ['1 < 2 & 3', u'caf\xe9'])
+    assert bytes(buffer) == EXPECTED
+    f = io.BytesIO()
+    twiml.write(f, ['1 < 2 & 3', u'caf\xe9'])
+    assert f.getvalue() == EXPECTED
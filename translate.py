@@ -0,0 +1,234 @@
+import collections
+import hashlib
+import os
+import sys
+
+import engine
+import numeric
+import sessions
+import simple
+import words
+
+# Bump whenever the generated code changes shape, so stale files on disk
+# are never picked up.
+VERSION = 1
+CACHE = os.path.join(words.CACHE, 'sessions')
+CACHE_SIZE = 4096
+OPERATIONS = ('times', 'over', 'minus', 'integral', 'coerce')
+
+
+class Literal(object):
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Operation(object):
+    __slots__ = ('tier', 'operation', 'operands')
+
+    def __init__(self, tier, operation, operands):
+        self.tier = tier
+        self.operation = operation
+        self.operands = operands
+
+
+class Symbolic(object):
+    # Stands in for a numeric.Numeric while engine.SIMPLE.execute runs:
+    # instead of computing, each operation records a node, so the real state
+    # machine decides what a session means and this module only writes it down.
+    def __init__(self, tier):
+        self.tier = tier
+
+    def times(self, left, right):
+        return Operation(self.tier, 'times', (left, right))
+
+    def over(self, left, right):
+        return Operation(self.tier, 'over', (left, right))
+
+    def minus(self, left, right):
+        return Operation(self.tier, 'minus', (left, right))
+
+    def integral(self, value):
+        return Operation(self.tier, 'integral', (value,))
+
+    def coerce(self, value):
+        return Operation(self.tier, 'coerce', (value,))
+
+
+def symbolic_code(code):
+    # A fresh node for every literal: compiled code shares its Number
+    # objects between sessions, and nodes must not be shared.
+    return tuple(
+        (op, word, engine.Number(Literal(literal.number)) if engine.PUSH == op else literal)
+        for op, word, literal in code
+    )
+
+
+def trace(messages, spec):
+    sym2val = sessions.Env(sessions.MAX_HISTORY, record=False)
+    tiers = [numeric.load(spec).spec()]
+    numbers = Symbolic(0)
+    for message in messages:
+        if message.startswith(':numeric'):
+            try:
+                tier = numeric.parse(message[len(':numeric'):].strip()).spec()
+            except ValueError:
+                continue
+            if tier not in tiers:
+                tiers.append(tier)
+            numbers = Symbolic(tiers.index(tier))
+            # As Program.configure does, carry stored values into the tier.
+            for values in sym2val.values():
+                for i, value in enumerate(values):
+                    values[i] = engine.Number(numbers.coerce(value.number))
+            continue
+        if message.startswith(':reactive'):
+            # Reactive mode recomputes what depends on a symbol when it is
+            # rebound, and the straight-line code here has no such graph.
+            if 'on' == message[len(':reactive'):].strip():
+                raise ValueError("Can't translate a session that turns on reactive mode")
+            continue
+        code = engine.SIMPLE.compile(message)
+        if code:
+            engine.SIMPLE.execute(symbolic_code(code), sym2val, numbers)
+    symbol2node = dict(
+        (symbol, values[-1].number)
+        for symbol, values in sym2val.items()
+        if values
+    )
+    return symbol2node, tiers
+
+
+def generate(symbol2node, tiers):
+    # A literal a symbol ends up bound to directly becomes an input; every
+    # other node is emitted once, in dependency order, behind its inputs.
+    node2input = {}
+    for symbol in sorted(symbol2node):
+        node = symbol2node[symbol]
+        if isinstance(node, Literal) and 'that' != symbol and id(node) not in node2input:
+            node2input[id(node)] = symbol
+
+    header = [
+        '# Generated by translate.py from a session; do not edit.',
+        'from decimal import Decimal',
+        'import numeric',
+        '',
+    ]
+    for i, tier in enumerate(tiers):
+        header.append('N%d = numeric.load(%r)' % (i, tier))
+        for operation in OPERATIONS:
+            header.append('%s%d = N%d.%s' % (operation, i, i, operation))
+    body = []
+    names = {}
+    constants = {}
+
+    def emit(node):
+        name = names.get(id(node))
+        if name is not None:
+            return name
+        if isinstance(node, Literal):
+            constant = constants.get(str(node.value))
+            if constant is None:
+                constant = constants[str(node.value)] = 'C%d' % len(constants)
+                header.append('%s = Decimal(%r)' % (constant, str(node.value)))
+            symbol = node2input.get(id(node))
+            if symbol is None:
+                return constant
+            name = 'v%d' % len(names)
+            body.append('    %s = inputs.get(%r, %s)' % (name, symbol, constant))
+        else:
+            operands = ', '.join([emit(operand) for operand in node.operands])
+            name = 'v%d' % len(names)
+            body.append('    %s = %s%d(%s)' % (name, node.operation, node.tier, operands))
+        names[id(node)] = name
+        return name
+
+    results = ['%r: %s' % (symbol, emit(symbol2node[symbol])) for symbol in sorted(symbol2node)]
+    lines = header + ['', '', 'def session(inputs):'] + body
+    lines.append('    return {%s}' % ', '.join(results))
+    return '\n'.join(lines) + '\n'
+
+
+def translate(messages, spec=numeric.DEFAULT):
+    return generate(*trace(messages, spec))
+
+
+def key(messages, spec):
+    text = '\n'.join(['%d' % VERSION, spec] + list(messages))
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def replay(messages, spec):
+    program = simple.Program()
+    if spec:
+        program.message(':numeric ' + spec)
+    for message in messages:
+        program.message(message)
+    return dict(
+        (symbol, values[-1].number)
+        for symbol, values in program.sym2val.items()
+        if values
+    )
+
+
+def validate(function, messages, spec):
+    expected = replay(messages, spec)
+    actual = function({})
+    if sorted((symbol, str(value)) for symbol, value in actual.items()) != sorted((symbol, str(value)) for symbol, value in expected.items()):
+        raise ValueError('Translation disagrees with the interpreter: %r != %r' % (actual, expected))
+
+
+def define(source, path):
+    namespace = {}
+    exec(compile(source, path, 'exec'), namespace)
+    return namespace['session']
+
+
+def write(path, source):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Write then rename, like the word list cache.
+    temporary = '%s.%d' % (path, os.getpid())
+    with open(temporary, 'w') as f:
+        f.write(source)
+    os.rename(temporary, path)
+
+
+key2function = collections.OrderedDict()
+
+
+def load(messages, spec=numeric.DEFAULT, cache=CACHE):
+    messages = tuple(messages)
+    name = key(messages, spec)
+    function = key2function.pop(name, None)
+    if function is None:
+        path = os.path.join(cache, name + '.py')
+        if os.path.exists(path):
+            with open(path) as f:
+                function = define(f.read(), path)
+        else:
+            source = translate(messages, spec)
+            function = define(source, path)
+            validate(function, messages, spec)
+            write(path, source)
+    key2function[name] = function
+    while len(key2function) > CACHE_SIZE:
+        key2function.popitem(last=False)
+    return function
+
+
+def main(argv):
+    import replay
+    for path in argv:
+        for session in replay.read_sessions(path):
+            sys.stdout.write('# %s:%d\n' % (path, session.line))
+            try:
+                sys.stdout.write(translate([message for _, message, _ in session.exchanges]) + '\n')
+            except ValueError as e:
+                sys.stdout.write('# %s\n\n' % e)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
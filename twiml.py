@@ -0,0 +1,42 @@
+PREFIX = b'<?xml version="1.0" encoding="UTF-8"?>\n<Response>\n'
+MESSAGE_PREFIX = b'    <Message>\n        <Body>'
+MESSAGE_SUFFIX = b'</Body>\n    </Message>\n'
+SUFFIX = b'</Response>'
+ONE_PREFIX = PREFIX + MESSAGE_PREFIX
+ONE_SUFFIX = MESSAGE_SUFFIX + SUFFIX
+
+
+def escape(text):
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+
+def response2bytes(response):
+    return ONE_PREFIX + escape(response).encode('utf-8') + ONE_SUFFIX
+
+
+def responses2bytes(responses):
+    buffer = bytearray(PREFIX)
+    for response in responses:
+        buffer += MESSAGE_PREFIX
+        buffer += escape(response).encode('utf-8')
+        buffer += MESSAGE_SUFFIX
+    buffer += SUFFIX
+    return bytes(buffer)
+
+
+def write(buffer, responses):
+    # For servers that hand out a writable buffer (bytearray or a file-like
+    # object's write), skipping the joined intermediate entirely.
+    out = buffer.extend if hasattr(buffer, 'extend') else buffer.write
+    out(PREFIX)
+    for response in responses:
+        out(MESSAGE_PREFIX)
+        out(escape(response).encode('utf-8'))
+        out(MESSAGE_SUFFIX)
+    out(SUFFIX)
@@ -0,0 +1,4 @@
+import simple
+import webhook
+
+app = webhook.make_app(simple)
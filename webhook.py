@@ -0,0 +1,66 @@
+import atexit
+import json
+import os
+
+from flask import (
+    Flask,
+    request,
+)
+
+import admission
+import idempotency
+import metrics
+import twiml
+
+# With NOLANG_SNAPSHOT set, sessions are written there on the way out and the
+# next start serves from it at once, paging each phone in when it is seen.
+# One process per file: with several workers, the last one out wins.
+SNAPSHOT = os.environ.get('NOLANG_SNAPSHOT', '')
+
+
+def post2message(request):
+    return (request.form.get('From', ''), request.form.get('Body', ''), request.form.get('MessageSid', ''))
+
+
+def get2message(request):
+    return (request.args.get('From', ''), request.args.get('Body', ''), request.args.get('MessageSid', ''))
+
+
+def make_app(module):
+    # The webhook for one interpreter module (simple or nois): anything with
+    # reply(phone, message) and its sessions in phone2env.
+    app = Flask(module.__name__)
+    if SNAPSHOT:
+        atexit.register(module.phone2env.save, SNAPSHOT)
+
+    def reply2twiml(phone, message, sid):
+        # A retried delivery of the same MessageSid gets the bytes rendered
+        # the first time instead of running the message again. A shed
+        # message is answered with a 200 "busy" reply, which the provider
+        # does not retry: the sender has to send it again. It is not cached,
+        # so a later delivery of that MessageSid is evaluated.
+        try:
+            body = idempotency.replies.compute(sid, lambda: admission.run(
+                phone, lambda: twiml.response2bytes(module.reply(phone, message)),
+            ), declined=admission.Busy)
+        except admission.Busy:
+            body = admission.BUSY
+        return app.response_class(body, status=200, content_type='text/xml')
+
+    @app.route('/message', methods=('GET',))
+    def message_get():
+        return reply2twiml(*get2message(request))
+
+    @app.route('/message', methods=('POST',))
+    def message_post():
+        return reply2twiml(*post2message(request))
+
+    @app.route('/metrics', methods=('GET',))
+    def metrics_get():
+        snapshot = metrics.snapshot()
+        snapshot['sessions'] = module.phone2env.stats()
+        snapshot['idempotency'] = idempotency.replies.stats()
+        snapshot['admission'] = admission.stats()
+        return app.response_class(json.dumps(snapshot, sort_keys=True), status=200, content_type='application/json')
+
+    return app
@@ -0,0 +1,67 @@
+import mmap
+import os
+import struct
+
+DICTIONARY = '/usr/share/dict/words'
+CACHE = os.path.join(os.path.expanduser('~'), '.cache', 'nolang')
+MAGIC = b'NOLW'
+HEADER = struct.Struct('<4sI')
+OFFSET = struct.Struct('<II')
+
+path2wordlist = {}
+
+
+def build(source, target):
+    with open(source, 'rb') as f:
+        allwords = [line.strip() for line in f]
+    allwords = [word for word in allwords if word]
+    offsets = [0]
+    for word in allwords:
+        offsets.append(offsets[-1] + len(word))
+    directory = os.path.dirname(target)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Write then rename so concurrently starting workers never map a
+    # half-written file.
+    temporary = '%s.%d' % (target, os.getpid())
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(allwords)))
+        f.write(struct.pack('<%dI' % len(offsets), *offsets))
+        f.write(b''.join(allwords))
+    os.rename(temporary, target)
+
+
+class WordList(object):
+    def __init__(self, source, path):
+        self.source = source
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a word list' % path)
+        self.base = HEADER.size + 4 * (self.count + 1)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('word list index out of range')
+        start, end = OFFSET.unpack_from(self.map, HEADER.size + 4 * index)
+        return self.map[self.base + start:self.base + end].decode('utf-8')
+
+    def __reduce__(self):
+        return load, (self.source,)
+
+
+def load(source=DICTIONARY):
+    wordlist = path2wordlist.get(source)
+    if wordlist is None:
+        name = os.path.abspath(source).strip(os.sep).replace(os.sep, '_') + '.bin'
+        target = os.path.join(CACHE, name)
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+            build(source, target)
+        wordlist = path2wordlist[source] = WordList(source, target)
+    return wordlist